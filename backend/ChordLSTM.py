@@ -1,4 +1,5 @@
 import torch.nn as nn
+from torch.nn.utils.rnn import pack_padded_sequence
 
 class ChordLSTM(nn.Module):
     def __init__(self, vocab_size: int, hidden_dim: int):
@@ -20,9 +21,30 @@ class ChordLSTM(nn.Module):
         self.duration_head = nn.Linear(hidden_dim * 2, 8)
 
     def forward(self, x):
+        chord_logits, duration_logits, _ = self.step(x)
+        return chord_logits, duration_logits
+
+    def step(self, x, state=None):
+        # x: (batch, steps) -> logits for the last step + (h, c) to carry forward
         embedded = self.dropout(self.embedding(x))
-        lstm_out, _ = self.lstm(embedded)
+        lstm_out, state = self.lstm(embedded, state)
         last_hidden = lstm_out[:, -1, :]
         chord_logits = self.chord_head(last_hidden)
         duration_logits = self.duration_head(last_hidden)
-        return chord_logits, duration_logits
+        return chord_logits, duration_logits, state
+
+    def forward_sequence(self, x, state=None):
+        # x: (batch, steps) -> logits at every step, (batch, steps, classes), for teacher-forced training
+        embedded = self.dropout(self.embedding(x))
+        lstm_out, state = self.lstm(embedded, state)
+        chord_logits = self.chord_head(lstm_out)
+        duration_logits = self.duration_head(lstm_out)
+        return chord_logits, duration_logits, state
+
+    def forward_packed(self, x, lengths):
+        # x: (batch, steps) padded, lengths: (batch,) on the cpu -> logits for the real steps only,
+        # in PackedSequence order; pack the targets with the same lengths to line them up
+        embedded = self.dropout(self.embedding(x))
+        packed = pack_padded_sequence(embedded, lengths, batch_first=True, enforce_sorted=False)
+        lstm_out, _ = self.lstm(packed)
+        return self.chord_head(lstm_out.data), self.duration_head(lstm_out.data)
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from typing import List, Tuple, Optional
+
+from decoding import check_temperatures
+from inference import InferenceExecutor, InferenceQueueFull
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationBatcher:
+    """Coalesces concurrent generation requests into one padded model batch.
+
+    `generator` is any engine with ChordGenerator's generate_batch signature.
+
+    Requests arriving within `window_ms` of the first queued one (or until
+    `max_batch_size` is reached) are stepped through the model together.
+    A batch is only collected once an executor worker is free, so requests
+    that queue up behind a running batch are coalesced into the next one.
+    """
+
+    def __init__(self, generator, executor: InferenceExecutor, window_ms: float = 2.0,
+                 max_batch_size: int = 32):
+        self.generator = generator
+        self.executor = executor
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(executor.workers)
+        self._task: Optional[asyncio.Task] = None
+        self._running = set()
+        # counters
+        self.batches = 0
+        self.requests = 0
+        self.rejected = 0
+        self.max_seen_batch_size = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, seed_progression: List[str], length: int, temperature: float) -> List[Tuple[str, int]]:
+        if self._queue.qsize() >= self.executor.max_queue:
+            self.rejected += 1
+            raise InferenceQueueFull(f"Generation queue is full ({self._queue.qsize()} requests waiting)")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((seed_progression, length, temperature, future))
+        return await future
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": self.window * 1000.0,
+            "max_batch_size": self.max_batch_size,
+            "batches": self.batches,
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "average_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "max_seen_batch_size": self.max_seen_batch_size,
+            "queued": self._queue.qsize()
+        }
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch_size:
+            # take whatever is already waiting, then wait out the window
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            # callers that went away while queued don't need a row
+            batch = [item for item in batch if not item[3].done()]
+            if not batch:
+                self._slots.release()
+                continue
+            self.batches += 1
+            self.requests += len(batch)
+            self.max_seen_batch_size = max(self.max_seen_batch_size, len(batch))
+            task = loop.create_task(self._run_batch(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run_batch(self, batch: list):
+        # generate_batch fails the whole batch on one bad temperature, so fail just that caller here
+        valid = []
+        for item in batch:
+            try:
+                check_temperatures([item[2]])
+            except ValueError as e:
+                item[3].set_exception(e)
+            else:
+                valid.append(item)
+        if not valid:
+            self._slots.release()
+            return
+        seeds, lengths, temperatures, futures = zip(*valid)
+        try:
+            progressions = await self.executor.run(
+                self.generator.generate_batch,
+                list(seeds),
+                temperatures=list(temperatures),
+                lengths=list(lengths)
+            )
+        except Exception as e:
+            if not isinstance(e, InferenceQueueFull):
+                logger.error(f"Error generating batch of {len(batch)}: {e}")
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+        for future, progression in zip(futures, progressions):
+            if not future.done():
+                future.set_result(progression)
@@ -0,0 +1,79 @@
+import argparse
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+import torch
+import logging
+from ChordLSTM import ChordLSTM
+from data_loader import BatchLoader, create_chord_vocabulary, load_cached_dataset
+from instrumentation import synchronize
+from train import ChordTrainer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# (name, compile, precision, read metrics back every step)
+CONFIGURATIONS = [
+    ('fp32, sync every step', False, 'fp32', True),
+    ('fp32', False, 'fp32', False),
+    ('bf16', False, 'bf16', False),
+    ('compile fp32', True, 'fp32', False),
+    ('compile bf16', True, 'bf16', False)
+]
+
+
+def time_steps(trainer: ChordTrainer, batches: List[Tuple[torch.Tensor, ...]], warmup: int, sync_every_step: bool) -> float:
+    """Mean seconds per optimizer step, data loading excluded"""
+    for batch in batches[:warmup]:
+        trainer.train_step(*batch).tolist()
+    synchronize(trainer.device)
+    totals = torch.zeros(3, device=trainer.device)
+    start = time.perf_counter()
+    for batch in batches[warmup:]:
+        metrics = trainer.train_step(*batch)
+        if sync_every_step:
+            # what train_epoch used to do with three .item() calls
+            metrics.tolist()
+        else:
+            totals += metrics
+    totals.tolist()
+    return (time.perf_counter() - start) / (len(batches) - warmup)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ChordTrainer step time across training configurations')
+    parser.add_argument('--data_path', type=str, default='dataset.pkl', help='Path to dataset pickle file')
+    parser.add_argument('--cache_dir', type=str, default='cache/', help='Directory for compiled, memory-mapped datasets')
+    parser.add_argument('--sequence_length', type=int, default=3, help='Length of input sequences')
+    parser.add_argument('--batch_size', type=int, default=32, help='Batch size')
+    parser.add_argument('--hidden_dim', type=int, default=64, help='Hidden dimension')
+    parser.add_argument('--steps', type=int, default=200, help='Timed steps per configuration')
+    parser.add_argument('--warmup', type=int, default=20, help='Untimed steps first (includes compilation)')
+    parser.add_argument('--device', type=str, default=None, help='Device (default: mps when available, else cpu)')
+    args = parser.parse_args()
+    device = torch.device(args.device or ("mps" if torch.backends.mps.is_available() else "cpu"))
+    chord_to_idx = {chord: idx for idx, chord in enumerate(create_chord_vocabulary())}
+    dataset = load_cached_dataset(Path(args.data_path), args.sequence_length, chord_to_idx, Path(args.cache_dir))
+    batches = []
+    while len(batches) < args.warmup + args.steps:
+        for sequences, chord_targets, duration_targets in BatchLoader(dataset, args.batch_size, drop_last=True):
+            batches.append((sequences.to(device), chord_targets.to(device), (duration_targets - 1).to(device)))
+    batches = batches[:args.warmup + args.steps]
+    print(f"\n{'configuration':<24} {'ms/step':>9} {'samples/s':>11}")
+    for name, compile_model, precision, sync_every_step in CONFIGURATIONS:
+        torch.manual_seed(0)
+        model = ChordLSTM(vocab_size=len(chord_to_idx), hidden_dim=args.hidden_dim).to(device)
+        try:
+            trainer = ChordTrainer(model, device, compile_model=compile_model, precision=precision)
+            trainer.train_model.train()
+            seconds = time_steps(trainer, batches, args.warmup, sync_every_step)
+        except Exception as e:
+            # bf16 is cpu only, and inductor support varies by device and platform
+            logger.warning(f"{name} failed: {e}")
+            continue
+        print(f"{name:<24} {seconds * 1000:>9.3f} {args.batch_size / seconds:>11,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import asyncio
+import statistics
+import time
+from typing import Dict, List
+
+import torch
+import logging
+from benchmarks.common import SEED, result
+
+logger = logging.getLogger(__name__)
+
+LENGTHS = [8, 32]
+CONCURRENCY = 32
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+async def _measure(app, requests: int, rounds: int) -> Dict[str, Dict]:
+    import httpx
+    results = {}
+    # ASGITransport does not run lifespan events, so start the executor and batcher by hand
+    await app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://benchmark') as client:
+            for length in LENGTHS:
+                payload = {'length': length}
+                for _ in range(10):
+                    (await client.post('/generate', json=payload)).raise_for_status()
+                # one request at a time: latency
+                latencies = []
+                for _ in range(requests):
+                    start = time.perf_counter()
+                    (await client.post('/generate', json=payload)).raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                name = f'api.generate.length={length}'
+                results[f'{name}.p50'] = result(statistics.median(latencies) * 1000, 'ms')
+                results[f'{name}.p90'] = result(_percentile(latencies, 0.9) * 1000, 'ms')
+                # CONCURRENCY requests in flight: throughput with the batcher coalescing them
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    responses = await asyncio.gather(*(client.post('/generate', json=payload) for _ in range(CONCURRENCY)))
+                    for response in responses:
+                        response.raise_for_status()
+                seconds = time.perf_counter() - start
+                results[f'{name}.concurrency={CONCURRENCY}'] = result(
+                    rounds * CONCURRENCY / seconds, 'requests/s', lower_is_better=False
+                )
+    finally:
+        await app.router.shutdown()
+    return results
+
+
+def run(server, quick: bool = False) -> Dict[str, Dict]:
+    """/generate through an in-process ASGI client (httpx), including request validation and batching"""
+    try:
+        import httpx  # noqa: F401
+    except ImportError:
+        logger.warning("httpx is not installed; skipping the api benchmarks")
+        return {}
+    # httpx logs every request at INFO
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    torch.manual_seed(SEED)
+    return asyncio.run(_measure(server.app, requests=50 if quick else 200, rounds=3 if quick else 10))
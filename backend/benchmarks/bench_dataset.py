@@ -0,0 +1,29 @@
+import gc
+import tracemalloc
+from typing import Dict
+
+from benchmarks.common import SEED, chord_vocabulary, result, time_call
+from data_loader import ChordDataset
+from synthetic_dataset import synthetic_pieces
+
+SIZES = [1000, 10000, 50000]
+SEQUENCE_LENGTH = 3
+
+
+def run(server=None, quick: bool = False) -> Dict[str, Dict]:
+    """ChordDataset construction time and peak traced memory on synthetic corpora"""
+    chord_to_idx = chord_vocabulary()
+    results = {}
+    for size in SIZES[:2] if quick else SIZES:
+        pieces = synthetic_pieces(size, seed=SEED)
+        seconds = time_call(lambda: ChordDataset(pieces, SEQUENCE_LENGTH, chord_to_idx), repeat=3, min_time=0)
+        gc.collect()
+        # numpy reports its buffers to tracemalloc, so this covers the encoding intermediates
+        tracemalloc.start()
+        ChordDataset(pieces, SEQUENCE_LENGTH, chord_to_idx)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        name = f'dataset.chord_dataset.pieces={size}'
+        results[f'{name}.build'] = result(seconds * 1000, 'ms')
+        results[f'{name}.peak_memory'] = result(peak / 2 ** 20, 'MB')
+    return results
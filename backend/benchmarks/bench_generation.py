@@ -0,0 +1,24 @@
+from typing import Dict
+
+import torch
+from benchmarks.common import SEED, chord_vocabulary, random_model, result, time_call
+from generate import ChordGenerator
+
+LENGTHS = [8, 32, 128]
+TEMPERATURES = [0.5, 1.0, 2.0]
+
+
+def run(server, quick: bool = False) -> Dict[str, Dict]:
+    """Latency of one progression, from ChordGenerator directly and through main.generate_progression"""
+    repeat, min_time = (3, 0.05) if quick else (5, 0.2)
+    generator = ChordGenerator(random_model(), torch.device('cpu'), chord_vocabulary())
+    results = {}
+    for length in LENGTHS:
+        for temperature in TEMPERATURES:
+            torch.manual_seed(SEED)
+            seconds = time_call(lambda: generator.generate_progression(['I'] * 2, length, temperature), repeat, min_time)
+            results[f'generation.chord_generator.length={length}.temperature={temperature}'] = result(seconds * 1000, 'ms')
+            torch.manual_seed(SEED)
+            seconds = time_call(lambda: server.generate_progression(length, temperature, 'I'), repeat, min_time)
+            results[f'generation.main.length={length}.temperature={temperature}'] = result(seconds * 1000, 'ms')
+    return results
@@ -0,0 +1,21 @@
+from typing import Dict
+
+from benchmarks.common import result, time_call
+from voicing import MODES, NUMERALS, TONICS, roman_to_midi_notes, voice_progression
+
+
+def run(server=None, quick: bool = False) -> Dict[str, Dict]:
+    """roman_to_midi_notes over every numeral, tonic and mode, and voice_progression of a 32-chord progression"""
+    repeat, min_time = (3, 0.05) if quick else (5, 0.2)
+    calls = [(numeral, tonic, mode) for numeral in NUMERALS for tonic in TONICS for mode in MODES]
+    seconds = time_call(lambda: [roman_to_midi_notes(*call) for call in calls], repeat, min_time)
+    progression = (NUMERALS * 2)[:32]
+    return {
+        'voicing.roman_to_midi_notes': result(len(calls) / seconds, 'calls/s', lower_is_better=False),
+        'voicing.voice_progression.chords=32.tonics=1': result(
+            time_call(lambda: voice_progression(progression, ['C']), repeat, min_time) * 1e6, 'us'
+        ),
+        'voicing.voice_progression.chords=32.tonics=12': result(
+            time_call(lambda: voice_progression(progression), repeat, min_time) * 1e6, 'us'
+        )
+    }
@@ -0,0 +1,71 @@
+import os
+import platform
+import timeit
+from pathlib import Path
+from typing import Callable, Dict
+
+import torch
+from ChordLSTM import ChordLSTM
+from data_loader import create_chord_vocabulary
+
+# every benchmark seeds from this, so runs are comparable
+SEED = 0
+
+
+def result(value: float, unit: str, lower_is_better: bool = True) -> Dict:
+    return {'value': value, 'unit': unit, 'lower_is_better': lower_is_better}
+
+
+def time_call(fn: Callable[[], object], repeat: int = 5, min_time: float = 0.2) -> float:
+    """Best seconds per call of fn over repeat rounds of at least min_time each.
+
+    The minimum is the least noisy estimate; slower rounds measure
+    interference from the rest of the machine, not the code.
+    """
+    timer = timeit.Timer(fn)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return min(timer.timeit(number) / number for _ in range(repeat))
+
+
+def chord_vocabulary() -> Dict[str, int]:
+    return {chord: idx for idx, chord in enumerate(create_chord_vocabulary())}
+
+
+def random_model(hidden_dim: int = 64) -> ChordLSTM:
+    # randomly initialized weights, seeded; latency does not depend on training
+    torch.manual_seed(SEED)
+    model = ChordLSTM(vocab_size=len(chord_vocabulary()), hidden_dim=hidden_dim)
+    model.eval()
+    return model
+
+
+def write_random_checkpoint(path: Path, hidden_dim: int = 64) -> Path:
+    """A checkpoint in the train.py format, for loading the server without a trained model"""
+    torch.save({
+        'epoch': 0,
+        'model_state_dict': random_model(hidden_dim).state_dict(),
+        'vocab': chord_vocabulary(),
+        'config': {'hidden_dim': hidden_dim}
+    }, path)
+    return path
+
+
+def environment() -> Dict:
+    return {
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'torch_threads': torch.get_num_threads()
+    }
+
+
+def import_server(checkpoint_dir: Path):
+    """Import main.py serving a random checkpoint; main loads MODEL_PATH at import time"""
+    os.environ['INFERENCE_BACKEND'] = 'torch'
+    os.environ['MODEL_PATH'] = str(write_random_checkpoint(checkpoint_dir / 'random_model.pt'))
+    import main
+    return main
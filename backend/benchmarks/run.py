@@ -0,0 +1,112 @@
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import torch
+import logging
+from benchmarks import bench_api, bench_dataset, bench_generation, bench_voicing
+from benchmarks.common import environment, import_server
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# name -> run(server, quick) returning {metric: {'value', 'unit', 'lower_is_better'}}
+SUITES = {
+    'generation': bench_generation.run,
+    'api': bench_api.run,
+    'voicing': bench_voicing.run,
+    'dataset': bench_dataset.run
+}
+
+
+def run_suites(names: List[str], quick: bool = False) -> Dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        server = import_server(Path(checkpoint_dir))
+        for name in names:
+            start = time.perf_counter()
+            results.update(SUITES[name](server, quick=quick))
+            logger.info(f"{name} took {time.perf_counter() - start:.1f}s")
+    return {'environment': environment(), 'quick': quick, 'results': results}
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> Tuple[List[Tuple], List[str]]:
+    """Rows of (metric, baseline, current, relative change, status) and the names of regressed metrics.
+
+    A metric regresses when it is worse than the baseline by more than
+    threshold, relative to the baseline value.
+    """
+    rows, regressions = [], []
+    for name in sorted(set(baseline['results']) | set(current['results'])):
+        old, new = baseline['results'].get(name), current['results'].get(name)
+        if old is None or new is None:
+            rows.append((name, old and old['value'], new and new['value'], None, 'new' if old is None else 'missing'))
+            continue
+        change = (new['value'] - old['value']) / old['value'] if old['value'] else 0.0
+        # positive means worse
+        worse = change if new['lower_is_better'] else -change
+        status = 'REGRESSION' if worse > threshold else 'improved' if worse < -threshold else 'ok'
+        if status == 'REGRESSION':
+            regressions.append(name)
+        rows.append((name, old['value'], new['value'], change, status))
+    return rows, regressions
+
+
+def print_results(results: Dict):
+    print(f"\n{'metric':<64} {'value':>12}  unit")
+    for name, row in results['results'].items():
+        print(f"{name:<64} {row['value']:>12.4g}  {row['unit']}")
+
+
+def print_comparison(rows: List[Tuple]):
+    print(f"\n{'metric':<64} {'baseline':>12} {'current':>12} {'change':>8}  status")
+    for name, old, new, change, status in rows:
+        old = f"{old:.4g}" if old is not None else '-'
+        new = f"{new:.4g}" if new is not None else '-'
+        change = f"{change:+.1%}" if change is not None else '-'
+        print(f"{name:<64} {old:>12} {new:>12} {change:>8}  {status}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmarks for generation, voicing, the API and dataset builds')
+    parser.add_argument('--suites', type=str, default=','.join(SUITES), help=f'Comma-separated suites: {", ".join(SUITES)}')
+    parser.add_argument('--output', type=str, default='benchmark_results.json', help='Where to write the results')
+    parser.add_argument('--compare', type=str, default=None, help='Baseline results to compare against')
+    parser.add_argument('--current', type=str, default=None, help='Compare these saved results instead of running the suites')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Relative change that counts as a regression')
+    parser.add_argument('--quick', action='store_true', help='Fewer repeats and sizes, for a smoke test')
+    parser.add_argument('--threads', type=int, default=1, help='torch threads (fixed so results are comparable)')
+    args = parser.parse_args()
+    torch.set_num_threads(args.threads)
+    if args.current:
+        with open(args.current) as file:
+            current = json.load(file)
+    else:
+        names = [name.strip() for name in args.suites.split(',') if name.strip()]
+        unknown = set(names) - set(SUITES)
+        if unknown:
+            parser.error(f"Unknown suites {sorted(unknown)}; available: {list(SUITES)}")
+        current = run_suites(names, quick=args.quick)
+        with open(args.output, 'w') as file:
+            json.dump(current, file, indent=2)
+        logger.info(f"Wrote {args.output}")
+        print_results(current)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if baseline['environment'] != current['environment']:
+            logger.warning("Baseline was recorded in a different environment; differences may not be regressions")
+        rows, regressions = compare(baseline, current, args.threshold)
+        print_comparison(rows)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
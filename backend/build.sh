@@ -38,4 +38,4 @@ sleep 2
 pactl info || echo "PulseAudio failed to start"
 
 # Start your application
-cd backend && RENDER=true PYTHONPATH=$PYTHONPATH:/opt/render/project/src/backend gunicorn main:app --workers 1 --worker-class uvicorn.workers.UvicornWorker --bind 0.0.0.0:10000
\ No newline at end of file
+cd backend && RENDER=true PYTHONPATH=$PYTHONPATH:/opt/render/project/src/backend gunicorn -c gunicorn.conf.py main:app
\ No newline at end of file
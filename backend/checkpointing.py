@@ -0,0 +1,85 @@
+import os
+import queue
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+import torch
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def snapshot(obj: Any) -> Any:
+    """Copy of a (nested) state dict with every tensor detached and cloned to the cpu.
+
+    Training can keep updating the live tensors in place while the copy is
+    written out.
+    """
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {key: snapshot(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(value) for value in obj)
+    return obj
+
+
+def atomic_save(obj: Any, path: Path):
+    # write next to the target, then rename, so readers only ever see a complete file
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    descriptor, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            torch.save(obj, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        Path(temp_path).unlink(missing_ok=True)
+        raise
+
+
+class CheckpointWriter:
+    """Writes checkpoints on a background thread, in submission order.
+
+    submit() only queues an already-snapshotted object; the first write
+    error is raised from the next submit() or close().
+    """
+
+    def __init__(self, max_pending: int = 2):
+        # bounded, so a slow disk cannot pile up unbounded snapshots in memory
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.error: Optional[BaseException] = None
+        self.thread = threading.Thread(target=self._run, name='checkpoint-writer', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            obj, path = item
+            try:
+                atomic_save(obj, path)
+                logger.info(f"Saved checkpoint to {path}")
+            except BaseException as e:
+                self.error = self.error or e
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def submit(self, obj: Any, path: Path):
+        self._raise_error()
+        self.pending.put((obj, Path(path)))
+
+    def close(self):
+        """Wait for every queued write to finish"""
+        if self.thread.is_alive():
+            self.pending.put(None)
+            self.thread.join()
+        self._raise_error()
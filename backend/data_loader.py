@@ -1,79 +1,331 @@
+import hashlib
+import itertools
+import json
+import logging
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from pathlib import Path
 import torch
 from torch.utils.data import Dataset, DataLoader
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterator, List, Tuple, Optional
 import pickle
 
+import numpy as np
+
+logger = logging.getLogger(__name__)
 
 NOTES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+MAJOR_CHORD_TYPES = ['I', 'ii', 'iii', 'IV', 'V', 'vi', 'vii°']
+MINOR_CHORD_TYPES = ['i', 'ii°', 'III', 'iv', 'v', 'VI', 'VII']
+MAJOR_SCALE = [0, 2, 4, 5, 7, 9, 11]  # Scale degrees in semitones
+MINOR_SCALE = [0, 2, 3, 5, 7, 8, 10]
+# bump whenever the encoding or the cache layout changes
+CACHE_VERSION = 2
+CACHE_ARRAYS = ['tokens', 'durations', 'boundaries', 'offsets']
+# target for padded positions; nn.CrossEntropyLoss skips it by default
+IGNORE_INDEX = -100
+
+
+def _interval_lookups(chord_to_idx: Dict[str, int]) -> np.ndarray:
+    # [mode, interval above the tonic] -> chord index, -1 for non-scale tones; row 0 major, row 1 minor
+    lookups = np.full((2, 12), -1, dtype=np.int8)
+    for row, (scale, chord_types) in enumerate(((MAJOR_SCALE, MAJOR_CHORD_TYPES), (MINOR_SCALE, MINOR_CHORD_TYPES))):
+        for interval, chord in zip(scale, chord_types):
+            lookups[row, interval] = chord_to_idx[chord]
+    return lookups
+
+
+def encode_pieces(data_dict: Dict, chord_to_idx: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Run-length encode every piece into one flat token buffer.
+
+    Returns (tokens, durations, boundaries) where the i-th kept piece occupies
+    tokens[boundaries[i]:boundaries[i + 1]]. Pieces with a non-scale root are
+    dropped. The whole corpus is encoded in a handful of array operations;
+    per-root intermediates use narrow dtypes to keep peak memory down.
+    """
+    pieces = list(data_dict.values())
+    counts = np.fromiter((sum(map(len, piece['root'])) for piece in pieces), dtype=np.int64, count=len(pieces))
+    roots = np.fromiter(
+        itertools.chain.from_iterable(itertools.chain.from_iterable(piece['root'] for piece in pieces)),
+        dtype=np.int16, count=int(counts.sum())
+    )
+    tonics = np.fromiter((piece['tonic'] for piece in pieces), dtype=np.int16, count=len(pieces))
+    modes = np.fromiter((piece['mode'] == 'm' for piece in pieces), dtype=np.int8, count=len(pieces))
+    piece_ids = np.repeat(np.arange(len(pieces), dtype=np.int32), counts)
+    chords = _interval_lookups(chord_to_idx)[np.repeat(modes, counts), (roots - np.repeat(tonics, counts)) % 12]
+    # non-scale tone -> drop the whole piece
+    dropped = np.bincount(piece_ids[chords < 0], minlength=len(pieces)) > 0
+    kept = ~dropped[piece_ids]
+    chords, piece_ids = chords[kept], piece_ids[kept]
+    # a run starts wherever the chord or the piece changes
+    changes = (chords[1:] != chords[:-1]) | (piece_ids[1:] != piece_ids[:-1])
+    starts = np.concatenate(([0], np.flatnonzero(changes) + 1)) if len(chords) else np.empty(0, dtype=np.int64)
+    durations = np.diff(np.append(starts, len(chords)))
+    lengths = np.bincount(piece_ids[starts], minlength=len(pieces))[~dropped]
+    return chords[starts].astype(np.int64), durations, np.concatenate(([0], np.cumsum(lengths)))
+
+
+def window_offsets(boundaries: np.ndarray, sequence_length: int) -> np.ndarray:
+    # start of every window whose target is still inside the same piece
+    starts, ends = boundaries[:-1], boundaries[1:]
+    counts = np.maximum(ends - starts - sequence_length, 0)
+    piece_starts = np.repeat(starts, counts)
+    # position of each window within its piece
+    within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return piece_starts + within
+
 
 class ChordDataset(Dataset):
+    """Sliding windows over one flat token buffer.
+
+    Each token is stored once; window i is a strided view starting at
+    offsets[i], and its targets are the chord and duration right after it.
+    """
+
     def __init__(self, data_dict: Dict, sequence_length: int, chord_to_idx: Dict[str, int]):
-        # Initialize chord types based on mode
-        self.major_chord_types = ['I', 'ii', 'iii', 'IV', 'V', 'vi', 'vii°']
-        self.minor_chord_types = ['i', 'ii°', 'III', 'iv', 'v', 'VI', 'VII']
-        self.sequences = []
-        self.chord_targets = []
-        self.duration_targets = []
-        for piece_name, piece_data in data_dict.items():
-            result = self._process_roots(
-                piece_data['root'],
-                piece_data['tonic'],
-                piece_data['mode']
-            )
-            if result is None:
-                continue
-            chord_sequence, duration_sequence = result
-            if len(chord_sequence) >= sequence_length + 1:
-                for i in range(len(chord_sequence) - sequence_length):
-                    sequence = chord_sequence[i:i + sequence_length]
-                    next_chord = chord_sequence[i + sequence_length]
-                    next_duration = duration_sequence[i + sequence_length]
-                    sequence_idx = [chord_to_idx[chord] for chord in sequence]
-                    target_chord_idx = chord_to_idx[next_chord]
-                    self.sequences.append(sequence_idx)
-                    self.chord_targets.append(target_chord_idx)
-                    self.duration_targets.append(next_duration)
-        self.sequences = torch.LongTensor(self.sequences)
-        self.chord_targets = torch.LongTensor(self.chord_targets)
-        self.duration_targets = torch.LongTensor(self.duration_targets)
+        tokens, durations, boundaries = encode_pieces(data_dict, chord_to_idx)
+        self._set_arrays(tokens, durations, boundaries, window_offsets(boundaries, sequence_length), sequence_length)
+
+    @classmethod
+    def from_arrays(cls, tokens: np.ndarray, durations: np.ndarray, boundaries: np.ndarray, sequence_length: int,
+                    offsets: Optional[np.ndarray] = None, duration_unit: str = 'frames') -> 'ChordDataset':
+        # arrays may be memory-mapped; they are wrapped, not copied
+        dataset = cls.__new__(cls)
+        if offsets is None:
+            offsets = window_offsets(boundaries, sequence_length)
+        dataset._set_arrays(tokens, durations, boundaries, offsets, sequence_length, duration_unit=duration_unit)
+        return dataset
+
+    def _set_arrays(self, tokens: np.ndarray, durations: np.ndarray, boundaries: np.ndarray, offsets: np.ndarray,
+                    sequence_length: int, pieces: Optional[np.ndarray] = None, duration_unit: str = 'frames'):
+        self.sequence_length = sequence_length
+        # what a duration counts: 'frames' of a pickle's root lists, or 'chords' repeated in a CSV (ingest_csv.py)
+        self.duration_unit = duration_unit
+        self.tokens = torch.from_numpy(tokens)
+        self.durations = torch.from_numpy(durations)
+        self.boundaries = torch.from_numpy(boundaries)
+        self.offsets = torch.from_numpy(offsets)
+        # pieces this dataset draws windows from; a split keeps the buffers and narrows this
+        self.pieces = torch.from_numpy(pieces) if pieces is not None else torch.arange(len(boundaries) - 1)
+        # (len(tokens) - sequence_length + 1, sequence_length) view, no copy
+        self.windows = self.tokens.unfold(0, sequence_length, 1) if len(tokens) >= sequence_length \
+            else self.tokens.new_empty((0, sequence_length))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def split_pieces(self, val_fraction: float, seed: int = 0) -> Tuple['ChordDataset', 'ChordDataset']:
+        """(train, validation) datasets over disjoint random subsets of whole pieces.
+
+        Windows never cross pieces, so no validation target is seen in
+        training. Both halves share this dataset's token buffers.
+        """
+        pieces = self.pieces.numpy()
+        order = np.random.default_rng(seed).permutation(len(pieces))
+        num_val = int(round(len(pieces) * val_fraction))
+        val_pieces, train_pieces = np.sort(pieces[order[:num_val]]), np.sort(pieces[order[num_val:]])
+        boundaries, offsets = self.boundaries.numpy(), self.offsets.numpy()
+        offset_pieces = np.searchsorted(boundaries, offsets, side='right') - 1
+        halves = []
+        for subset in (train_pieces, val_pieces):
+            dataset = ChordDataset.__new__(ChordDataset)
+            dataset._set_arrays(self.tokens.numpy(), self.durations.numpy(), boundaries,
+                                offsets[np.isin(offset_pieces, subset)], self.sequence_length, subset,
+                                duration_unit=self.duration_unit)
+            halves.append(dataset)
+        return halves[0], halves[1]
+
+    def __getitem__(self, idx):
+        offset = self.offsets[idx]
+        target = offset + self.sequence_length
+        return self.windows[offset], self.tokens[target], self.durations[target]
+
+    def get_batch(self, indices: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        # gathers a whole batch in three indexing ops instead of one __getitem__ per sample
+        offsets = self.offsets[indices]
+        targets = offsets + self.sequence_length
+        return self.windows[offsets], self.tokens[targets], self.durations[targets]
+
+    # materialised (copied) views, for callers that want every window at once
+    @property
+    def sequences(self) -> torch.Tensor:
+        return self.windows[self.offsets]
+
+    @property
+    def chord_targets(self) -> torch.Tensor:
+        return self.tokens[self.offsets + self.sequence_length]
+
+    @property
+    def duration_targets(self) -> torch.Tensor:
+        return self.durations[self.offsets + self.sequence_length]
+
+
+class SequenceChunks:
+    """Whole pieces, cut into chunks of at most chunk_length steps, for teacher forcing.
+
+    Chunk i feeds tokens[starts[i]:starts[i] + lengths[i]] and is trained to
+    predict the chord and duration one step ahead at every position, so every
+    piece with at least two chords is used. Batches are padded to their
+    longest chunk with IGNORE_INDEX targets and also return the chunk lengths
+    for pack_padded_sequence. chunk_length=None keeps pieces whole.
+    """
+
+    def __init__(self, dataset: ChordDataset, chunk_length: Optional[int] = None):
+        self.tokens = dataset.tokens
+        self.durations = dataset.durations
+        boundaries = dataset.boundaries.numpy()
+        pieces = dataset.pieces.numpy()
+        # a piece of n chords has n - 1 next-chord targets
+        piece_starts, piece_ends = boundaries[pieces], boundaries[pieces + 1] - 1
+        if chunk_length is None:
+            chunk_length = max(int((piece_ends - piece_starts).max(initial=0)), 1)
+        self.chunk_length = chunk_length
+        counts = np.maximum(-(-(piece_ends - piece_starts) // chunk_length), 0)
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        starts = np.repeat(piece_starts, counts) + within * chunk_length
+        self.starts = torch.from_numpy(starts)
+        self.lengths = torch.from_numpy(np.minimum(np.repeat(piece_ends, counts) - starts, chunk_length))
 
     def __len__(self):
-        return len(self.sequences)
+        return len(self.starts)
 
     def __getitem__(self, idx):
-        return self.sequences[idx], self.chord_targets[idx], self.duration_targets[idx]
-
-    def _process_roots(self, root_matrix: List[List[int]], tonic: int, mode: str) -> Optional[
-        Tuple[List[str], List[int]]]:
-        major_scale = [0, 2, 4, 5, 7, 9, 11]  # Scale degrees in semitones
-        minor_scale = [0, 2, 3, 5, 7, 8, 10]
-        scale = minor_scale if mode == 'm' else major_scale
-        chord_types = self.minor_chord_types if mode == 'm' else self.major_chord_types
-        chord_progression = []
-        durations = []
-        current_chord = None
-        current_duration = 0
-        for bar in root_matrix:
-            for root in bar:
-                interval = (root - tonic) % 12
-                # non-scale tone -> None
-                if interval not in scale:
-                    return None
-                scale_index = scale.index(interval)
-                chord = chord_types[scale_index]
-                if chord != current_chord:
-                    if current_chord is not None:
-                        chord_progression.append(current_chord)
-                        durations.append(current_duration)
-                    current_chord = chord
-                    current_duration = 1
-                else:
-                    current_duration += 1
-        # final chord
-        if current_chord is not None:
-            chord_progression.append(current_chord)
-            durations.append(current_duration)
-        return chord_progression, durations
+        # fixed width so DataLoader's default collate can stack samples
+        inputs, chord_targets, duration_targets, lengths = self.get_batch(torch.tensor([idx]), self.chunk_length)
+        return inputs[0], chord_targets[0], duration_targets[0], lengths[0]
+
+    def num_targets(self) -> int:
+        return int(self.lengths.sum())
+
+    def get_batch(self, indices: torch.Tensor, width: Optional[int] = None) -> Tuple[torch.Tensor, ...]:
+        lengths = self.lengths[indices]
+        if width is None:
+            width = int(lengths.max()) if len(lengths) else 0
+        steps = torch.arange(width)
+        positions = self.starts[indices, None] + steps
+        padding = steps >= lengths[:, None]
+        # padded positions read index 0 and are masked below
+        positions = positions.masked_fill(padding, 0)
+        inputs = self.tokens[positions].masked_fill(padding, 0)
+        chord_targets = self.tokens[positions + 1].masked_fill(padding, IGNORE_INDEX)
+        duration_targets = self.durations[positions + 1].masked_fill(padding, IGNORE_INDEX)
+        return inputs, chord_targets, duration_targets, lengths
+
+
+class BatchLoader:
+    """In-process replacement for DataLoader over a ChordDataset or SequenceChunks.
+
+    Shuffles with one permutation per epoch and gathers each batch, a
+    contiguous slice of that permutation, straight from the dataset's
+    backing tensors, so there are no worker processes and no per-sample
+    collation. With prefetch > 0 a background thread keeps that many
+    batches ready. bucket_by_length groups SequenceChunks of similar length
+    into the same batch (batch order is still shuffled) to cut padding.
+
+    With world_size > 1 it also acts as the distributed sampler: every rank
+    draws the same permutation from seed + epoch (see set_epoch) and keeps
+    every world_size-th sample, padded so all ranks run the same number of
+    steps.
+    """
+
+    def __init__(self, dataset, batch_size: int, shuffle: bool = True, drop_last: bool = False,
+                 pin_memory: bool = False, prefetch: int = 0, generator: Optional[torch.Generator] = None,
+                 bucket_by_length: bool = False, rank: int = 0, world_size: int = 1, seed: int = 0):
+        self.dataset = dataset
+        self.bucket_by_length = bucket_by_length
+        self.rank = rank
+        self.world_size = world_size
+        self.seed = seed
+        self.epoch = 0
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.pin_memory = pin_memory
+        self.prefetch = prefetch
+        self.generator = generator
+
+    def __len__(self):
+        if self.drop_last:
+            return self._num_samples() // self.batch_size
+        return (self._num_samples() + self.batch_size - 1) // self.batch_size
+
+    def _num_samples(self) -> int:
+        # samples this rank sees per epoch
+        return -(-len(self.dataset) // self.world_size)
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def __iter__(self) -> Iterator[Tuple[torch.Tensor, torch.Tensor, torch.Tensor]]:
+        if self.prefetch > 0:
+            return self._prefetched()
+        return self._batches()
+
+    def batch_indices(self) -> List[torch.Tensor]:
+        """Dataset indices of every batch in one epoch"""
+        count = len(self.dataset)
+        if self.world_size > 1:
+            # same permutation on every rank, then this rank's stride of it
+            generator = torch.Generator().manual_seed(self.seed + self.epoch)
+            order = torch.randperm(count, generator=generator) if self.shuffle else torch.arange(count)
+            padding = self._num_samples() * self.world_size - count
+            order = torch.cat([order, order.repeat(-(-padding // max(count, 1)))[:padding]])[self.rank::self.world_size]
+        else:
+            order = torch.randperm(count, generator=self.generator) if self.shuffle else torch.arange(count)
+        if self.bucket_by_length:
+            # stable sort keeps the random order among chunks of equal length
+            order = order[torch.sort(self.dataset.lengths[order], stable=True).indices]
+        stop = len(self) * self.batch_size if self.drop_last else len(order)
+        batches = [order[start:start + self.batch_size] for start in range(0, stop, self.batch_size)]
+        if self.bucket_by_length and self.shuffle:
+            # same batch order on every rank, so ranks step through similar lengths together
+            generator = torch.Generator().manual_seed(self.seed + self.epoch) if self.world_size > 1 else self.generator
+            batches = [batches[i] for i in torch.randperm(len(batches), generator=generator).tolist()]
+        return batches
+
+    def _batches(self) -> Iterator[Tuple[torch.Tensor, torch.Tensor, torch.Tensor]]:
+        for indices in self.batch_indices():
+            batch = self.dataset.get_batch(indices)
+            if self.pin_memory:
+                batch = tuple(tensor.pin_memory() for tensor in batch)
+            yield batch
+
+    def _prefetched(self) -> Iterator[Tuple[torch.Tensor, torch.Tensor, torch.Tensor]]:
+        ready = queue.Queue(maxsize=self.prefetch)
+        done = object()
+        stop = threading.Event()
+
+        def produce():
+            try:
+                for batch in self._batches():
+                    if stop.is_set():
+                        return
+                    ready.put(batch)
+                ready.put(done)
+            except Exception as e:
+                ready.put(e)
+
+        thread = threading.Thread(target=produce, name="batch-prefetch", daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = ready.get()
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            # unblock a producer waiting on a full queue when the epoch is abandoned
+            while thread.is_alive():
+                try:
+                    ready.get_nowait()
+                except queue.Empty:
+                    thread.join(0.01)
 
 
 def create_chord_vocabulary() -> List[str]:
@@ -90,3 +342,84 @@ def load_dataset(path: str) -> Dict:
     with open(path, 'rb') as file:
         return pickle.load(file)
 
+
+def cache_key(data_path: Path, sequence_length: int, chord_to_idx: Dict[str, int]) -> str:
+    digest = hashlib.sha256()
+    with open(data_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    digest.update(json.dumps(
+        {'version': CACHE_VERSION, 'sequence_length': sequence_length, 'vocab': chord_to_idx}, sort_keys=True
+    ).encode())
+    return f"{Path(data_path).stem}-L{sequence_length}-{digest.hexdigest()[:16]}"
+
+
+def compile_dataset(data_path: Path, cache_path: Path, sequence_length: int, chord_to_idx: Dict[str, int]) -> Path:
+    """Encode a dataset pickle into a directory of .npy arrays plus meta.json.
+
+    The directory is written next to its final location and renamed into
+    place, so concurrent runs never see a half-written cache.
+    """
+    tokens, durations, boundaries = encode_pieces(load_dataset(str(data_path)), chord_to_idx)
+    arrays = {
+        'tokens': tokens,
+        'durations': durations,
+        'boundaries': boundaries,
+        'offsets': window_offsets(boundaries, sequence_length)
+    }
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(dir=cache_path.parent, prefix=f".{cache_path.name}."))
+    try:
+        for name in CACHE_ARRAYS:
+            np.save(staging / f'{name}.npy', arrays[name])
+        with open(staging / 'meta.json', 'w') as file:
+            json.dump({
+                'version': CACHE_VERSION,
+                'source': str(data_path),
+                'sequence_length': sequence_length,
+                'vocab': chord_to_idx,
+                'duration_unit': 'frames',
+                'pieces': len(boundaries) - 1,
+                'tokens': len(tokens),
+                'windows': len(arrays['offsets'])
+            }, file, indent=2)
+        os.replace(staging, cache_path)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        # another process renamed its copy into place first
+        if not (cache_path / 'meta.json').exists():
+            raise
+    return cache_path
+
+
+def load_compiled_dataset(cache_path: Path, mmap: bool = True, sequence_length: Optional[int] = None,
+                          chord_to_idx: Optional[Dict[str, int]] = None) -> ChordDataset:
+    with open(cache_path / 'meta.json') as file:
+        meta = json.load(file)
+    if meta['version'] != CACHE_VERSION:
+        raise ValueError(f"Dataset cache {cache_path} has version {meta['version']}, expected {CACHE_VERSION}")
+    if chord_to_idx is not None and meta['vocab'] != chord_to_idx:
+        raise ValueError(f"Dataset cache {cache_path} was compiled with a different vocabulary: {meta['vocab']}")
+    # copy-on-write maps: pages are shared between processes and torch gets a writable array
+    arrays = {
+        name: np.load(cache_path / f'{name}.npy', mmap_mode='c' if mmap else None, allow_pickle=False)
+        for name in CACHE_ARRAYS
+    }
+    if sequence_length is None or sequence_length == meta['sequence_length']:
+        return ChordDataset.from_arrays(
+            arrays['tokens'], arrays['durations'], arrays['boundaries'], meta['sequence_length'], arrays['offsets'],
+            duration_unit=meta['duration_unit']
+        )
+    # token streams do not depend on the window, only the offset index does
+    return ChordDataset.from_arrays(arrays['tokens'], arrays['durations'], arrays['boundaries'], sequence_length,
+                                    duration_unit=meta['duration_unit'])
+
+
+def load_cached_dataset(data_path: Path, sequence_length: int, chord_to_idx: Dict[str, int],
+                        cache_dir: Path, mmap: bool = True) -> ChordDataset:
+    """ChordDataset for a pickle, compiled on the first run and memory-mapped afterwards"""
+    cache_path = Path(cache_dir) / cache_key(data_path, sequence_length, chord_to_idx)
+    if not (cache_path / 'meta.json').exists():
+        logger.info(f"Compiling {data_path} into {cache_path}")
+        compile_dataset(data_path, cache_path, sequence_length, chord_to_idx)
+    return load_compiled_dataset(cache_path, mmap=mmap)
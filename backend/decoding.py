@@ -0,0 +1,56 @@
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+def batch_arguments(count: int, length: int, temperatures: Optional[List[float]],
+                    lengths: Optional[List[int]]) -> Tuple[List[float], List[int], int]:
+    """(temperatures, lengths, longest length) for a generate_batch call over count rows.
+
+    A temperature that is not > 0 fails the whole call. Callers that must
+    not fail each other check their own rows before batching them
+    (GenerationBatcher.submit). Negative lengths become empty progressions.
+    """
+    if temperatures is None:
+        temperatures = [1.0] * count
+    if lengths is None:
+        lengths = [length] * count
+    check_temperatures(temperatures)
+    lengths = [max(n, 0) for n in lengths]
+    return temperatures, lengths, max(lengths, default=0)
+
+
+def check_temperatures(temperatures: Sequence[float]):
+    # also rejects nan
+    if not all(temperature > 0 for temperature in temperatures):
+        raise ValueError(f"Temperatures must be positive, got {list(temperatures)}")
+
+
+def step_rows(step: Callable, sequence, temperature, lengths: List[int], max_length: int) -> Iterator[Tuple[int, List[int], object, object]]:
+    """Steps a batch until every row has lengths[row] chords, retiring rows as they finish.
+
+    step(sequence, temperature, state) returns (next chords, next durations,
+    state) for the rows still active, as 1-d arrays or tensors. Yields
+    (step index, active row numbers, chords, durations). Lengths are known
+    up front, so retiring rows never waits on the sampled values.
+    """
+    rows = list(range(len(lengths)))
+    state = None
+    for index in range(max_length):
+        chords, durations, state = step(sequence, temperature, state)
+        yield index, rows, chords, durations
+        sequence = chords[:, None]
+        keep = [i for i, row in enumerate(rows) if lengths[row] > index + 1]
+        if len(keep) < len(rows):
+            if not keep:
+                return
+            rows = [rows[i] for i in keep]
+            sequence, temperature = sequence[keep], temperature[keep]
+            state = tuple(s[:, keep] for s in state)
+
+
+def decode_rows(idx_to_chord: Dict[int, str], chord_rows: List[List[int]], duration_rows: List[List[int]],
+                lengths: List[int]) -> List[List[Tuple[str, int]]]:
+    # duration rows hold classes; durations start at 1
+    return [
+        [(idx_to_chord[chord_idx], duration + 1) for chord_idx, duration in zip(chord_row[:n], duration_row[:n])]
+        for chord_row, duration_row, n in zip(chord_rows, duration_rows, lengths)
+    ]
@@ -0,0 +1,44 @@
+import argparse
+from pathlib import Path
+
+import numpy as np
+import torch
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def export_checkpoint(checkpoint_path: Path, output_path: Path, as_directory: bool = False):
+    checkpoint = torch.load(checkpoint_path, map_location='cpu', weights_only=True)
+    chord_to_idx = checkpoint['vocab']
+    vocab = sorted(chord_to_idx, key=chord_to_idx.get)
+    weights = {
+        name: tensor.detach().cpu().numpy()
+        for name, tensor in checkpoint['model_state_dict'].items()
+    }
+    if as_directory:
+        # one .npy per array so the server can memory-map them (MMAP_WEIGHTS=1)
+        output_path.mkdir(parents=True, exist_ok=True)
+        np.save(output_path / 'vocab.npy', np.array(vocab))
+        for name, array in weights.items():
+            np.save(output_path / f'{name}.npy', array)
+    else:
+        np.savez(output_path, vocab=np.array(vocab), **weights)
+    logger.info(f"Exported {len(weights)} weight arrays to {output_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export a ChordLSTM checkpoint to a NumPy weight file')
+    parser.add_argument('--checkpoint', type=str, default='checkpoints/final_model.pt', help='Path to model checkpoint')
+    parser.add_argument('--output', type=str, default=None, help='Output path (defaults to the checkpoint path)')
+    parser.add_argument('--directory', action='store_true', help='Write a directory of .npy files that can be memory-mapped')
+    args = parser.parse_args()
+    checkpoint_path = Path(args.checkpoint)
+    default_output = checkpoint_path.with_suffix('') if args.directory else checkpoint_path.with_suffix('.npz')
+    output_path = Path(args.output) if args.output else default_output
+    export_checkpoint(checkpoint_path, output_path, as_directory=args.directory)
+
+
+if __name__ == "__main__":
+    main()
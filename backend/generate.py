@@ -1,10 +1,11 @@
 import argparse
 from pathlib import Path
-from typing import List, Tuple, Dict, Optional
+from typing import Iterator, List, Tuple, Dict, Optional
 
 import torch
 import logging
 from ChordLSTM import ChordLSTM
+from decoding import batch_arguments, decode_rows, step_rows
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,16 +19,22 @@ class ChordGenerator:
         self.idx_to_chord = {idx: chord for chord, idx in chord_to_idx.items()}
 
     def generate_progression(self, seed_progression: Optional[List[str]] = None, length: int = 8, temperature: float = 1.0) -> List[Tuple[str, int]]:
+        return list(self.stream_progression(seed_progression, length, temperature))
+
+    def stream_progression(self, seed_progression: Optional[List[str]] = None, length: int = 8, temperature: float = 1.0) -> Iterator[Tuple[str, int]]:
+        # yields each chord as soon as it is sampled
         if seed_progression is None:
             # seed with root
             seed_progression = ['I'] * 3
         self.model.eval()
         seed_indices = [self.chord_to_idx.get(chord, 0) for chord in seed_progression]
         current_sequence = torch.LongTensor([seed_indices]).to(self.device)
-        generated_progression = []
-        with torch.no_grad():
-            for _ in range(length):
-                chord_logits, duration_logits = self.model(current_sequence)
+        # the seed primes the recurrent state, then one chord is fed per step
+        state = None
+        for _ in range(length):
+            # grad mode is per thread and a stream may be resumed from another one
+            with torch.no_grad():
+                chord_logits, duration_logits, state = self.model.step(current_sequence, state)
                 # temperature
                 chord_logits = chord_logits / temperature
                 duration_logits = duration_logits / temperature
@@ -39,13 +46,35 @@ class ChordGenerator:
                 duration_probs = torch.softmax(duration_logits, dim=1)
                 duration_idx = torch.multinomial(duration_probs[0], 1).item()
                 next_duration = duration_idx + 1
-                generated_progression.append((next_chord, next_duration))
-                # update
-                current_sequence = torch.cat([
-                    current_sequence[:, 1:],
-                    torch.LongTensor([[next_chord_idx]]).to(self.device)
-                ], dim=1)
-        return generated_progression
+            yield next_chord, next_duration
+            # update
+            current_sequence = torch.LongTensor([[next_chord_idx]]).to(self.device)
+
+    def generate_batch(self, seed_progressions: List[List[str]], length: int = 8, temperatures: Optional[List[float]] = None,
+                       lengths: Optional[List[int]] = None) -> List[List[Tuple[str, int]]]:
+        # seeds must share a length so the batch can be stepped together
+        temperatures, lengths, max_length = batch_arguments(len(seed_progressions), length, temperatures, lengths)
+        if max_length == 0:
+            return [[] for _ in seed_progressions]
+        self.model.eval()
+        seed_indices = [[self.chord_to_idx.get(chord, 0) for chord in seed] for seed in seed_progressions]
+        current_sequence = torch.LongTensor(seed_indices).to(self.device)
+        temperature = torch.tensor(temperatures, dtype=torch.float, device=self.device).unsqueeze(1)
+        chord_out = torch.zeros(len(seed_progressions), max_length, dtype=torch.long, device=self.device)
+        duration_out = torch.zeros_like(chord_out)
+
+        def step(sequence, temperature, state):
+            chord_logits, duration_logits, state = self.model.step(sequence, state)
+            # sample every row at once, results stay on device until the end
+            chord_probs = torch.softmax(chord_logits / temperature, dim=1)
+            duration_probs = torch.softmax(duration_logits / temperature, dim=1)
+            return torch.multinomial(chord_probs, 1)[:, 0], torch.multinomial(duration_probs, 1)[:, 0], state
+
+        with torch.no_grad():
+            for index, rows, next_chords, next_durations in step_rows(step, current_sequence, temperature, lengths, max_length):
+                chord_out[rows, index] = next_chords
+                duration_out[rows, index] = next_durations
+        return decode_rows(self.idx_to_chord, chord_out.tolist(), duration_out.tolist(), lengths)
 
 
 def load_model(checkpoint_path: Path, device: torch.device) -> Tuple[ChordLSTM, Dict]:
@@ -53,7 +82,8 @@ def load_model(checkpoint_path: Path, device: torch.device) -> Tuple[ChordLSTM,
     chord_to_idx = checkpoint['vocab']
     model = ChordLSTM(
         vocab_size=len(chord_to_idx),
-        hidden_dim=64
+        # sweep checkpoints record their hidden_dim; older ones are all 64
+        hidden_dim=checkpoint.get('config', {}).get('hidden_dim', 64)
     ).to(device)
     model.load_state_dict(checkpoint['model_state_dict'])
     model.eval()
@@ -0,0 +1,25 @@
+import os
+import sys
+
+# Load main:app (and the model) once in the master; forked workers then
+# share the weights copy-on-write instead of each loading their own copy.
+preload_app = True
+
+# one worker unless asked for more; each worker runs its own inference executor and threads
+workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = os.environ.get("BIND", "0.0.0.0:10000")
+
+INFERENCE_THREADS = int(os.environ.get("INFERENCE_THREADS", "1"))
+# read by OpenMP when torch is imported during preload, so the master never starts a
+# thread pool that would be forked into every worker
+os.environ.setdefault("OMP_NUM_THREADS", str(INFERENCE_THREADS))
+
+
+def post_fork(server, worker):
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        # OpenMP thread pools do not survive fork; reset torch's before the worker runs anything
+        torch.set_num_threads(INFERENCE_THREADS)
+        # every worker inherits the master's generator state and would sample the same progressions
+        torch.seed()
@@ -0,0 +1,87 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceQueueFull(Exception):
+    pass
+
+
+class InferenceExecutor:
+    """Bounded thread pool that keeps CPU-bound model calls off the event loop.
+
+    At most `workers` jobs run at once and at most `max_queue` more wait;
+    anything beyond that is rejected with InferenceQueueFull.
+    """
+
+    def __init__(self, workers: int = 1, max_queue: int = 64, num_threads: int = 1, num_interop_threads: int = 1,
+                 set_torch_threads: bool = True):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.num_threads = num_threads
+        self.num_interop_threads = num_interop_threads
+        self.set_torch_threads = set_torch_threads
+        self._pool: Optional[ThreadPoolExecutor] = None
+        # counters, only touched from the event loop
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def start(self):
+        if self._pool is not None:
+            return
+        if self.set_torch_threads:
+            # imported here so the numpy backend never loads torch
+            import torch
+            torch.set_num_threads(self.num_threads)
+            try:
+                torch.set_num_interop_threads(self.num_interop_threads)
+            except RuntimeError as e:
+                # can only be set once per process, before any inter-op work
+                logger.warning(f"Could not set inter-op threads: {e}")
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        logger.info(
+            f"Inference executor started: {self.workers} worker(s), queue {self.max_queue}, "
+            f"{self.num_threads} intra-op / {self.num_interop_threads} inter-op thread(s)"
+        )
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def has_capacity(self) -> bool:
+        return self.pending < self.workers + self.max_queue
+
+    def check_capacity(self):
+        """Raise InferenceQueueFull, and count the rejection, if a job submitted now would be refused"""
+        if not self.has_capacity():
+            self.rejected += 1
+            raise InferenceQueueFull(f"Inference queue is full ({self.pending} jobs pending)")
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        self.check_capacity()
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, functools.partial(fn, *args, **kwargs))
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    async def warmup(self, fn: Callable, *args, **kwargs):
+        # one call per worker so every thread pays its lazy init before real traffic
+        await asyncio.gather(*(self.run(fn, *args, **kwargs) for _ in range(self.workers)))
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected
+        }
@@ -0,0 +1,253 @@
+import argparse
+import csv
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import logging
+from data_loader import CACHE_ARRAYS, CACHE_VERSION, MAJOR_CHORD_TYPES, create_chord_vocabulary, window_offsets
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# what to do with a numeral that is not in the vocabulary
+OOV_POLICIES = ['degree', 'skip', 'drop', 'error']
+ROMAN_DEGREES = {'I': 1, 'II': 2, 'III': 3, 'IV': 4, 'V': 5, 'VI': 6, 'VII': 7}
+# degree, optional diminished marker, then accidentals written after the numeral (VI#, VIIb)
+NUMERAL_PATTERN = re.compile(r'^([IViv]+)(°|o)?([#b]*)$')
+
+
+def normalize_numeral(numeral: str, chord_to_idx: Dict[str, int], policy: str) -> Tuple[Optional[int], str]:
+    """Vocabulary index for a CSV numeral and how it was resolved.
+
+    CSV numerals are relative to a major key, so only the major-key chords
+    match as they are. The vocabulary's minor-mode tokens (v, III, VI, ...)
+    are relative to a minor tonic and name different roots, so they never
+    match a CSV numeral. Under 'degree' anything else (minor-mode spellings,
+    accidentals, borrowed or secondary chords) maps to the diatonic
+    major-key chord on the same letter degree, e.g. v -> V, VI# -> vi,
+    II -> ii, vii -> vii°. Accidentals and quality are dropped, so distinct
+    numerals collapse onto one chord (VI# and vi# both become vi).
+    """
+    numeral = numeral.strip()
+    if numeral in MAJOR_CHORD_TYPES:
+        return chord_to_idx[numeral], 'exact'
+    if policy == 'error':
+        raise ValueError(f"Numeral {numeral!r} is not a major-key chord in the vocabulary")
+    if policy == 'degree':
+        match = NUMERAL_PATTERN.match(numeral)
+        degree = ROMAN_DEGREES.get(match.group(1).upper()) if match else None
+        if degree is not None:
+            return chord_to_idx[MAJOR_CHORD_TYPES[degree - 1]], 'mapped'
+    return None, 'oov'
+
+
+def encode_rows(rows: List[str], column: int, chord_to_idx: Dict[str, int], policy: str):
+    """Parse one chunk of CSV lines into run-length encoded token streams.
+
+    Every row with a progression becomes one piece; each chord counts as one
+    unit of duration and repeated chords merge into longer durations. The
+    CSV has no timing, so durations count chords ('chords' in meta.json),
+    not the frames a compiled pickle counts.
+    """
+    tokens, durations, lengths = [], [], []
+    stats = Counter()
+    cache = {}
+    for row in csv.reader(rows):
+        stats['rows'] += 1
+        progression = row[column] if column < len(row) else ''
+        piece = []
+        for numeral in progression.split('-'):
+            if not numeral.strip():
+                continue
+            if numeral not in cache:
+                cache[numeral] = normalize_numeral(numeral, chord_to_idx, policy)
+            idx, resolution = cache[numeral]
+            stats[resolution] += 1
+            if resolution != 'exact':
+                # per source numeral, so the report shows what each collapsed to or lost
+                stats[(resolution, numeral.strip())] += 1
+            if idx is None and policy == 'drop':
+                piece = None
+                break
+            if idx is not None:
+                piece.append(idx)
+        if not piece:
+            stats['dropped_rows'] += 1
+            continue
+        piece_durations = []
+        for idx in piece:
+            if piece_durations and tokens[-1] == idx:
+                piece_durations[-1] += 1
+            else:
+                tokens.append(idx)
+                piece_durations.append(1)
+        durations.extend(piece_durations)
+        lengths.append(len(piece_durations))
+    return (
+        np.array(tokens, dtype=np.int64),
+        np.array(durations, dtype=np.int64),
+        np.array(lengths, dtype=np.int64),
+        stats
+    )
+
+
+def _numeral_counts(stats: Counter, resolution: str) -> List[Tuple[str, int]]:
+    counts = [(key[1], count) for key, count in stats.items() if isinstance(key, tuple) and key[0] == resolution]
+    return sorted(counts, key=lambda item: -item[1])
+
+
+def read_chunks(file, chunk_rows: int) -> Iterator[List[str]]:
+    # physical lines grouped into chunks; a chunk only ends outside a quoted field
+    chunk, quotes = [], 0
+    for line in file:
+        chunk.append(line)
+        quotes += line.count('"')
+        if len(chunk) >= chunk_rows and quotes % 2 == 0:
+            yield chunk
+            chunk, quotes = [], 0
+    if chunk:
+        yield chunk
+
+
+def _raw_to_npy(raw_path: Path, npy_path: Path, block: int = 1 << 20):
+    # copy an int64 stream into a .npy in fixed-size blocks so memory stays flat
+    count = raw_path.stat().st_size // 8
+    if count == 0:
+        np.save(npy_path, np.empty(0, dtype=np.int64))
+    else:
+        array = np.lib.format.open_memmap(npy_path, mode='w+', dtype=np.int64, shape=(count,))
+        with open(raw_path, 'rb') as file:
+            for start in range(0, count, block):
+                values = np.fromfile(file, dtype=np.int64, count=block)
+                array[start:start + len(values)] = values
+        array.flush()
+        del array
+    raw_path.unlink()
+
+
+def ingest_csv(csv_path: Path, output_path: Path, sequence_length: int, chord_to_idx: Dict[str, int],
+               policy: str = 'degree', workers: int = 1, chunk_rows: int = 10000, column: str = 'Progression') -> Dict:
+    """Stream a progressions CSV into the compiled dataset layout of data_loader.compile_dataset.
+
+    Chunks are encoded on a process pool with at most 2 * workers chunks in
+    flight, and results are appended to disk in order, so memory use does
+    not depend on the size of the CSV.
+    """
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(dir=output_path.parent, prefix=f".{output_path.name}."))
+    outputs = {name: open(staging / f'{name}.bin', 'wb') for name in CACHE_ARRAYS}
+    stats = Counter()
+    idx_to_chord = {idx: chord for chord, idx in chord_to_idx.items()}
+    written = pieces = windows = 0
+    start_time = time.perf_counter()
+    try:
+        np.zeros(1, dtype=np.int64).tofile(outputs['boundaries'])
+        with open(csv_path, newline='') as file, ProcessPoolExecutor(max_workers=workers) as pool:
+            header = next(csv.reader([file.readline()]))
+            if column not in header:
+                raise ValueError(f"{csv_path} has no {column!r} column: {header}")
+            column_index = header.index(column)
+            pending = deque()
+            chunks = read_chunks(file, chunk_rows)
+            while True:
+                while len(pending) < 2 * workers:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    pending.append(pool.submit(encode_rows, chunk, column_index, chord_to_idx, policy))
+                if not pending:
+                    break
+                tokens, durations, lengths, chunk_stats = pending.popleft().result()
+                boundaries = np.concatenate(([0], np.cumsum(lengths)))
+                tokens.tofile(outputs['tokens'])
+                durations.tofile(outputs['durations'])
+                (boundaries[1:] + written).tofile(outputs['boundaries'])
+                offsets = window_offsets(boundaries, sequence_length) + written
+                offsets.tofile(outputs['offsets'])
+                written += len(tokens)
+                windows += len(offsets)
+                pieces += len(lengths)
+                stats.update(chunk_stats)
+                elapsed = time.perf_counter() - start_time
+                logger.info(f"{stats['rows']} rows, {stats['rows'] / elapsed:,.0f} rows/s")
+        for name in CACHE_ARRAYS:
+            outputs[name].close()
+            _raw_to_npy(staging / f'{name}.bin', staging / f'{name}.npy')
+        elapsed = time.perf_counter() - start_time
+        report = {
+            'rows': stats['rows'],
+            'pieces': pieces,
+            'tokens': written,
+            'windows': windows,
+            'exact': stats['exact'],
+            'mapped': stats['mapped'],
+            'oov': stats['oov'],
+            'dropped_rows': stats['dropped_rows'],
+            # source numeral -> the vocabulary chord it collapsed to, most frequent first
+            'mapped_numerals': {
+                numeral: {'chord': idx_to_chord[normalize_numeral(numeral, chord_to_idx, policy)[0]], 'count': count}
+                for numeral, count in _numeral_counts(stats, 'mapped')
+            },
+            'oov_numerals': dict(_numeral_counts(stats, 'oov')),
+            'seconds': elapsed,
+            'rows_per_second': stats['rows'] / elapsed if elapsed else 0.0
+        }
+        with open(staging / 'meta.json', 'w') as file:
+            json.dump({
+                'version': CACHE_VERSION,
+                'source': str(csv_path),
+                'sequence_length': sequence_length,
+                'vocab': chord_to_idx,
+                'oov_policy': policy,
+                'duration_unit': 'chords',
+                'pieces': pieces,
+                'tokens': written,
+                'windows': windows
+            }, file, indent=2)
+        if output_path.exists():
+            shutil.rmtree(output_path)
+        os.replace(staging, output_path)
+        return report
+    finally:
+        for output in outputs.values():
+            output.close()
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile a progressions CSV into the training dataset format')
+    parser.add_argument('--csv', type=str, default='progressions.csv', help='CSV with a Progression column such as I-vi-IV-V')
+    parser.add_argument('--output', type=str, default=None, help='Output directory (default: cache/<csv name>-L<sequence_length>)')
+    parser.add_argument('--sequence_length', type=int, default=3, help='Length of input sequences')
+    parser.add_argument('--oov', type=str, default='degree', choices=OOV_POLICIES,
+                        help='Out-of-vocabulary numerals: map to the diatonic chord on the same degree, skip the chord, '
+                             'drop the row, or fail')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Parser processes')
+    parser.add_argument('--chunk_rows', type=int, default=10000, help='CSV lines per chunk')
+    args = parser.parse_args()
+    csv_path = Path(args.csv)
+    output_path = Path(args.output) if args.output else Path('cache') / f"{csv_path.stem}-L{args.sequence_length}"
+    chord_to_idx = {chord: idx for idx, chord in enumerate(create_chord_vocabulary())}
+    report = ingest_csv(csv_path, output_path, args.sequence_length, chord_to_idx, policy=args.oov,
+                        workers=args.workers, chunk_rows=args.chunk_rows)
+    logger.info(f"Wrote {output_path}")
+    numerals = {key: report.pop(key) for key in ('mapped_numerals', 'oov_numerals')}
+    for key, value in report.items():
+        print(f"  {key:<16} {value:,.2f}" if isinstance(value, float) else f"  {key:<16} {value:,}")
+    for numeral, mapped in numerals['mapped_numerals'].items():
+        print(f"  mapped {numeral:<9} -> {mapped['chord']:<5} {mapped['count']:,}")
+    for numeral, count in numerals['oov_numerals'].items():
+        print(f"  oov    {numeral:<9} {count:,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import json
+import sys
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import torch
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+# per-step phases timed by ChordTrainer when instrumented
+PHASES = ['data', 'forward', 'backward', 'optimizer']
+
+
+def synchronize(device: torch.device):
+    # wait for queued kernels, so host timers measure the work and not its launch
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    elif device.type == 'mps':
+        torch.mps.synchronize()
+
+
+def peak_memory_mb(device: torch.device) -> float:
+    """Peak allocated device memory on cuda, otherwise the peak resident size of this process"""
+    if device.type == 'cuda':
+        return torch.cuda.max_memory_allocated(device) / 2 ** 20
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+class StepLog:
+    """Appends one JSON object per training step to a file"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.file = open(self.path, 'w')
+
+    def write(self, row: Dict):
+        self.file.write(json.dumps(row) + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+def parse_step_range(value: str) -> Tuple[int, int]:
+    """'START:END' -> (start, end), the global training steps to profile, end exclusive"""
+    start, _, end = value.partition(':')
+    start, end = int(start), int(end)
+    if not 0 <= start < end:
+        raise ValueError(f"Invalid profile step range {value!r}; expected START:END with 0 <= START < END")
+    return start, end
+
+
+def make_profiler(start: int, end: int, trace_path: Path, device: torch.device) -> torch.profiler.profile:
+    """torch.profiler over global steps [start, end), written as a Chrome trace when the range ends.
+
+    The caller enters it and calls .step() after every training step.
+    """
+    activities = [torch.profiler.ProfilerActivity.CPU]
+    if device.type == 'cuda':
+        activities.append(torch.profiler.ProfilerActivity.CUDA)
+
+    def export(profiler: torch.profiler.profile):
+        profiler.export_chrome_trace(str(trace_path))
+        logger.info(f"Wrote profiler trace for steps {start}-{end - 1} to {trace_path}")
+
+    # one step of profiler warmup when there is room for it
+    warmup = min(start, 1)
+    return torch.profiler.profile(
+        activities=activities,
+        schedule=torch.profiler.schedule(wait=start - warmup, warmup=warmup, active=end - start, repeat=1),
+        on_trace_ready=export,
+        record_shapes=True
+    )
+
+
+def summarize_steps(path: Path, skip: int = 0) -> Optional[Dict[str, float]]:
+    """Mean of every numeric field over a step log, ignoring the first skip steps"""
+    with open(path) as file:
+        rows = [json.loads(line) for line in file if line.strip()][skip:]
+    if not rows:
+        return None
+    return {key: sum(row[key] for row in rows) / len(rows) for key in rows[0] if isinstance(rows[0][key], (int, float))}
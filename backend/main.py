@@ -1,14 +1,17 @@
-from urllib.request import Request
-
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Tuple, Optional
+from pydantic import BaseModel, Field
+from typing import Annotated, Dict, List, Tuple, Optional
 from pathlib import Path
-import torch
+import os
+import json
 import logging
-from ChordLSTM import ChordLSTM
-from player import ChordPlayer
+from batcher import GenerationBatcher
+from inference import InferenceExecutor, InferenceQueueFull
+from metrics import CONTENT_TYPE, INFERENCE_PENDING, REGISTRY, InstrumentedEngine, MetricsMiddleware
+from transition_table import TransitionTable
+from voicing import MODES, NOTES, TONICS, voice_progression
 
 # logging
 logging.basicConfig(level=logging.INFO)
@@ -32,8 +35,51 @@ app.add_middleware(
 )
 
 # model setup
-device = torch.device("cpu")  # Use CPU for serving
-MODEL_PATH = "checkpoints/final_model.pt"
+# "torch" serves ChordLSTM, "numpy" serves weights from export_numpy.py without importing torch
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "torch")
+if INFERENCE_BACKEND == "numpy":
+    from numpy_lstm import NumpyChordGenerator, load_numpy_model
+    device = None
+elif INFERENCE_BACKEND == "torch":
+    import torch
+    from ChordLSTM import ChordLSTM
+    from generate import ChordGenerator
+    device = torch.device("cpu")  # Use CPU for serving
+else:
+    raise ValueError(f"Unknown INFERENCE_BACKEND: {INFERENCE_BACKEND}")
+MODEL_PATH = os.environ.get(
+    "MODEL_PATH",
+    "checkpoints/final_model.npz" if INFERENCE_BACKEND == "numpy" else "checkpoints/final_model.pt"
+)
+# map weights from disk so worker processes share one copy through the page cache
+MMAP_WEIGHTS = os.environ.get("MMAP_WEIGHTS", "").lower() in ("1", "true")
+SEQUENCE_LENGTH = 2  # same as training
+# dynamic int8 quantization (torch backend), refused if top-1 agreement with fp32 is too low
+QUANTIZE_INT8 = os.environ.get("QUANTIZE_INT8", "").lower() in ("1", "true")
+QUANTIZE_MIN_AGREEMENT = float(os.environ.get("QUANTIZE_MIN_AGREEMENT", "0.98"))
+QUANTIZE_PARITY_DATA = os.environ.get("QUANTIZE_PARITY_DATA")
+# "lstm" runs the model per step, "table" samples from precomputed distributions
+GENERATION_ENGINE = os.environ.get("GENERATION_ENGINE", "lstm")
+# start the deprecated FluidSynth ChordPlayer (needs a soundfont and an audio server)
+ENABLE_PLAYER = os.environ.get("ENABLE_PLAYER", "").lower() in ("1", "true")
+# request coalescing for /generate
+BATCH_WINDOW_MS = float(os.environ.get("BATCH_WINDOW_MS", "2"))
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "32"))
+# most progressions one /generate_batch request may ask for, independent of request coalescing
+MAX_PROGRESSIONS = int(os.environ.get("MAX_PROGRESSIONS", "64"))
+# longest progression one request may ask for
+MAX_LENGTH = int(os.environ.get("MAX_LENGTH", "256"))
+# inference thread pool
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", "1"))
+INFERENCE_MAX_QUEUE = int(os.environ.get("INFERENCE_MAX_QUEUE", "64"))
+INFERENCE_THREADS = int(os.environ.get("INFERENCE_THREADS", "1"))
+INFERENCE_INTEROP_THREADS = int(os.environ.get("INFERENCE_INTEROP_THREADS", "1"))
+# structured access log: this share of requests, plus every 5xx and every slow request
+REQUEST_LOG_SAMPLE_RATE = float(os.environ.get("REQUEST_LOG_SAMPLE_RATE", "0"))
+REQUEST_LOG_SLOW_MS = float(os.environ.get("REQUEST_LOG_SLOW_MS", "1000"))
+
+# per-route counts and latency for /metrics
+app.add_middleware(MetricsMiddleware, sample_rate=REQUEST_LOG_SAMPLE_RATE, slow_ms=REQUEST_LOG_SLOW_MS)
 
 class PlayRequest(BaseModel):
     progression: List[dict]
@@ -42,37 +88,102 @@ class PlayRequest(BaseModel):
     mode: str = "M"
 
 player = None
+executor = InferenceExecutor(
+    workers=INFERENCE_WORKERS,
+    max_queue=INFERENCE_MAX_QUEUE,
+    num_threads=INFERENCE_THREADS,
+    num_interop_threads=INFERENCE_INTEROP_THREADS,
+    set_torch_threads=INFERENCE_BACKEND == "torch"
+)
+batcher = None
 
 @app.on_event("startup")
 async def startup_event():
+    global player, batcher
+    executor.start()
+    # warm up so the first request doesn't pay for lazy init
+    await executor.warmup(
+        engine.generate_batch,
+        [['I'] * SEQUENCE_LENGTH] * MAX_BATCH_SIZE,
+        length=SEQUENCE_LENGTH
+    )
+    logger.info("Inference warmup done")
+    batcher = GenerationBatcher(engine, executor, window_ms=BATCH_WINDOW_MS, max_batch_size=MAX_BATCH_SIZE)
+    batcher.start()
+    if ENABLE_PLAYER:
+        get_player()
+
+def get_player():
+    """Start the FluidSynth player on first use; voicing never needs it"""
     global player
-    player = ChordPlayer()
-    print("ChordPlayer initialized")
+    if player is None:
+        from player import ChordPlayer
+        player = ChordPlayer()
+        print("ChordPlayer initialized")
+    return player
 
 @app.on_event("shutdown")
 async def shutdown_event():
     global player
+    if batcher:
+        await batcher.stop()
+    executor.shutdown()
     if player:
         player.cleanup()
         print("ChordPlayer cleaned up")
 
 
-def load_model(checkpoint_path: Path) -> Tuple[ChordLSTM, dict]:
-    checkpoint = torch.load(checkpoint_path, map_location=device, weights_only=True)
+def load_model(checkpoint_path: Path) -> Tuple['ChordLSTM', dict]:
+    checkpoint = torch.load(checkpoint_path, map_location=device, weights_only=True, mmap=MMAP_WEIGHTS)
     chord_to_idx = checkpoint['vocab']
     model = ChordLSTM(
         vocab_size=len(chord_to_idx),
-        hidden_dim=64
+        # sweep checkpoints record their hidden_dim; older ones are all 64
+        hidden_dim=checkpoint.get('config', {}).get('hidden_dim', 64)
     ).to(device)
-    model.load_state_dict(checkpoint['model_state_dict'])
+    # assign keeps the mapped tensors instead of copying them into fresh parameters
+    model.load_state_dict(checkpoint['model_state_dict'], assign=MMAP_WEIGHTS)
     model.eval()
     return model, chord_to_idx
 
 
+def reload_model(checkpoint_path: Path = Path(MODEL_PATH)):
+    """Load the checkpoint and rebuild every engine derived from it"""
+    global model, chord_to_idx, idx_to_chord, generator, transition_table, engine
+    if INFERENCE_BACKEND == "numpy":
+        model, chord_to_idx = load_numpy_model(checkpoint_path, mmap=MMAP_WEIGHTS)
+        generator = NumpyChordGenerator(model, chord_to_idx)
+    else:
+        model, chord_to_idx = load_model(checkpoint_path)
+        if QUANTIZE_INT8:
+            from quantize import quantize_model, parity_contexts, parity_report, check_parity
+            quantized = quantize_model(model)
+            contexts = parity_contexts(
+                chord_to_idx, SEQUENCE_LENGTH, Path(QUANTIZE_PARITY_DATA) if QUANTIZE_PARITY_DATA else None
+            )
+            report = parity_report(model, quantized, contexts)
+            logger.info(f"Quantized model parity: {report}")
+            check_parity(report, QUANTIZE_MIN_AGREEMENT)
+            model = quantized
+        generator = ChordGenerator(model, device, chord_to_idx)
+    idx_to_chord = {idx: chord for chord, idx in chord_to_idx.items()}
+    transition_table = None
+    engine = generator
+    if GENERATION_ENGINE == "table":
+        transition_table = TransitionTable.from_model(model, chord_to_idx, SEQUENCE_LENGTH, device)
+        logger.info(f"Built transition table for {len(transition_table.chord_logits)} contexts")
+        engine = transition_table
+    elif GENERATION_ENGINE != "lstm":
+        raise ValueError(f"Unknown GENERATION_ENGINE: {GENERATION_ENGINE}")
+    # times every batch and streamed step for /metrics
+    engine = InstrumentedEngine(engine, f"{INFERENCE_BACKEND}/{GENERATION_ENGINE}")
+    if batcher:
+        batcher.generator = engine
+
+
 # load model
 try:
-    model, chord_to_idx = load_model(Path(MODEL_PATH))
-    idx_to_chord = {idx: chord for chord, idx in chord_to_idx.items()}
+    reload_model()
     logger.info("Model loaded successfully")
 except Exception as e:
     logger.error(f"Error loading model: {e}")
@@ -80,52 +191,81 @@ except Exception as e:
 
 
 class GenerationRequest(BaseModel):
-    length: int = 8
-    temperature: float = 1.0
+    length: int = Field(8, ge=0, le=MAX_LENGTH)
+    temperature: float = Field(1.0, gt=0)
     start_chord: str = 'I'
+    tonic: str = 'C'
+    mode: str = 'M'
+    # also voice the progression in all 12 keys
+    all_tonics: bool = False
+
+class BatchGenerationRequest(BaseModel):
+    # bounded so one request is never an unbounded job on the executor
+    num_progressions: int = Field(4, ge=1, le=MAX_PROGRESSIONS)
+    length: int = Field(8, ge=0, le=MAX_LENGTH)
+    # one value for every progression, or one per progression
+    temperatures: List[Annotated[float, Field(gt=0)]] = [1.0]
+    start_chords: List[str] = ['I']
+    tonic: str = 'C'
+    mode: str = 'M'
+    all_tonics: bool = False
 
 class ProgressionResponse(BaseModel):
     chords: List[dict]
     durations: List[int]
     total_bars: float
+    # tonic -> notes per chord, only when all_tonics was requested
+    transpositions: Optional[Dict[str, List[List[int]]]] = None
+
+class BatchProgressionResponse(BaseModel):
+    progressions: List[ProgressionResponse]
 
 def generate_progression(
     length: int,
     temperature: float = 1.0,
     start_chord: str = None
 ) -> Tuple[List[str], List[int]]:
-    sequence_length = 2  # same as training
     # default to roo
     start = start_chord if start_chord else 'I'
-    seed_progression = [start] * sequence_length
-    seed_indices = [chord_to_idx.get(chord, 0) for chord in seed_progression]
-    current_sequence = torch.LongTensor([seed_indices]).to(device)
-    chords = []
-    durations = []
-    with torch.no_grad():
-        for _ in range(length):
-            chord_logits, duration_logits = model(current_sequence)
-            # temp
-            chord_logits = chord_logits / temperature
-            duration_logits = duration_logits / temperature
-            # next chord
-            chord_probs = torch.softmax(chord_logits, dim=1)
-            next_chord_idx = torch.multinomial(chord_probs[0], 1).item()
-            next_chord = idx_to_chord[next_chord_idx]
-            # next dur
-            duration_probs = torch.softmax(duration_logits, dim=1)
-            duration_idx = torch.multinomial(duration_probs[0], 1).item()
-            next_duration = duration_idx + 1
-            chords.append(next_chord)
-            durations.append(next_duration)
-            # update
-            current_sequence = torch.cat([
-                current_sequence[:, 1:],
-                torch.LongTensor([[next_chord_idx]]).to(device)
-            ], dim=1)
+    seed_progression = [start] * SEQUENCE_LENGTH
+    progression = engine.generate_batch([seed_progression], length=length, temperatures=[temperature])[0]
+    chords = [chord for chord, _ in progression]
+    durations = [duration for _, duration in progression]
     return chords, durations
 
 
+def check_key(tonic: str, mode: str):
+    if tonic not in NOTES:
+        raise HTTPException(status_code=400, detail=f"Invalid tonic. Available tonics: {list(NOTES.keys())}")
+    if mode not in MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid mode. Available modes: {MODES}")
+
+
+def build_progression_response(chords: List[str], durations: List[int], tonic: str = 'C', mode: str = 'M',
+                               all_tonics: bool = False) -> ProgressionResponse:
+    # one table lookup voices the whole progression, in one key or all twelve
+    voicings = voice_progression(chords, [tonic] + TONICS if all_tonics else [tonic], mode).tolist()
+    chord_data = [{"chord": chord, "notes": notes} for chord, notes in zip(chords, voicings[0])]
+    total_bars = sum(d / 8.0 for d in durations)
+    return ProgressionResponse(
+        chords=chord_data,
+        durations=durations,
+        total_bars=total_bars,
+        transpositions=dict(zip(TONICS, voicings[1:])) if all_tonics else None
+    )
+
+
+def broadcast(values: list, count: int, name: str) -> list:
+    if len(values) == 1:
+        return values * count
+    if len(values) != count:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Expected 1 or {count} {name}, got {len(values)}"
+        )
+    return values
+
+
 @app.get("/available_chords")
 async def get_available_chords():
     """Return the list of available chord symbols"""
@@ -140,54 +280,159 @@ async def generate(request: GenerationRequest):
                 status_code=400,
                 detail=f"Invalid start chord. Available chords: {list(chord_to_idx.keys())}"
             )
-        chords, durations = generate_progression(
+        check_key(request.tonic, request.mode)
+        progression = await batcher.submit(
+            [request.start_chord] * SEQUENCE_LENGTH,
             length=request.length,
-            temperature=request.temperature,
-            start_chord=request.start_chord
+            temperature=request.temperature
         )
-
-        chord_data = []
-        for chord in chords:
-            notes = player.roman_to_midi_notes(chord, "C", "M")
-            chord_data.append({
-                "chord": chord,
-                "notes": notes
-            })
-
-        total_bars = sum(d / 8.0 for d in durations)
-
-        return ProgressionResponse(
-            chords=chord_data,
-            durations=durations,
-            total_bars=total_bars
+        return build_progression_response(
+            [chord for chord, _ in progression],
+            [duration for _, duration in progression],
+            request.tonic,
+            request.mode,
+            request.all_tonics
         )
+    except HTTPException:
+        raise
+    except InferenceQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Error generating progression: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate_batch", response_model=BatchProgressionResponse)
+async def generate_batch(request: BatchGenerationRequest):
+    try:
+        start_chords = broadcast(request.start_chords, request.num_progressions, "start_chords")
+        temperatures = broadcast(request.temperatures, request.num_progressions, "temperatures")
+        invalid = [chord for chord in start_chords if chord not in chord_to_idx]
+        if invalid:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid start chord(s) {invalid}. Available chords: {list(chord_to_idx.keys())}"
+            )
+        check_key(request.tonic, request.mode)
+        progressions = await executor.run(
+            engine.generate_batch,
+            [[start] * SEQUENCE_LENGTH for start in start_chords],
+            length=request.length,
+            temperatures=temperatures
+        )
+        return BatchProgressionResponse(progressions=[
+            build_progression_response(
+                [chord for chord, _ in progression],
+                [duration for _, duration in progression],
+                request.tonic,
+                request.mode,
+                request.all_tonics
+            )
+            for progression in progressions
+        ])
+    except HTTPException:
+        raise
+    except InferenceQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error generating progressions: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/generate_stream")
+async def generate_stream(request: GenerationRequest):
+    """Stream each chord as a server-sent event as soon as it is sampled"""
+    if request.start_chord not in chord_to_idx:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid start chord. Available chords: {list(chord_to_idx.keys())}"
+        )
+    check_key(request.tonic, request.mode)
+    try:
+        # refuse up front: once the stream starts the status is already 200
+        executor.check_capacity()
+    except InferenceQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    steps = engine.stream_progression(
+        [request.start_chord] * SEQUENCE_LENGTH,
+        length=request.length,
+        temperature=request.temperature
+    )
+
+    async def events():
+        total_bars = 0.0
+        try:
+            for index in range(request.length):
+                # each step runs on the executor so a long stream never blocks the loop
+                chord, duration = await executor.run(next, steps)
+                total_bars += duration / 8.0
+                voicings = voice_progression([chord], [request.tonic] + TONICS if request.all_tonics else [request.tonic],
+                                             request.mode)[:, 0].tolist()
+                payload = {"index": index, "chord": chord, "notes": voicings[0], "duration": duration}
+                if request.all_tonics:
+                    payload["transpositions"] = dict(zip(TONICS, voicings[1:]))
+                yield f"event: chord\ndata: {json.dumps(payload)}\n\n"
+            yield f"event: done\ndata: {json.dumps({'total_bars': total_bars})}\n\n"
+        except InferenceQueueFull as e:
+            # the queue filled up between two steps
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+        except Exception as e:
+            logger.error(f"Error streaming progression: {e}")
+            yield f"event: error\ndata: {json.dumps({'detail': 'Error generating progression'})}\n\n"
+        finally:
+            try:
+                steps.close()
+            except ValueError:
+                # client went away while a step was still running on the executor
+                pass
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "model_loaded": model is not None}
 
 
+@app.get("/stats")
+async def stats():
+    """Request coalescing and inference executor counters"""
+    return {
+        "batcher": batcher.stats() if batcher else None,
+        "executor": executor.stats()
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text format: request counts and latency per route, engine step time and throughput"""
+    INFERENCE_PENDING.set(executor.pending)
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
 @app.post("/play")
 async def play(request: PlayRequest):
     try:
         logger.info(f"Generating notes for progression: {request.progression}")
 
         # Return the chord information with actual notes to play
-        chord_data = []
-        for chord in request.progression:
-            notes = player.roman_to_midi_notes(chord['chord'], request.tonic, request.mode)
-            chord_data.append({
+        voicings = voice_progression([chord['chord'] for chord in request.progression], [request.tonic], request.mode)
+        chord_data = [
+            {
                 'chord': chord['chord'],
                 'duration': chord['duration'],
                 'notes': notes  # MIDI note numbers
-            })
+            }
+            for chord, notes in zip(request.progression, voicings[0].tolist())
+        ]
 
         return {"chord_data": chord_data}
 
+    except ValueError as e:
+        # unknown numeral, tonic or mode
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error processing progression: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -204,19 +449,14 @@ async def get_drum_patterns():
 @app.post("/stop")
 async def stop():
     try:
-        player.stop_playback()
+        # nothing can be playing if the player was never started
+        if player is not None:
+            player.stop_playback()
         return {"status": "success"}
     except Exception as e:
         print(f"Error stopping playback: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    print(f"[DEBUG] Received {request.method} request to {request.url}")
-    print(f"[DEBUG] Headers: {request.headers}")
-    response = await call_next(request)
-    return response
-
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
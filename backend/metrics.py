@@ -0,0 +1,262 @@
+import bisect
+import json
+import logging
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+access_logger = logging.getLogger('access')
+
+# prometheus_client's defaults, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STEP_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 0.01, 0.025, 0.05, 0.1)
+# starlette appends the charset
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(ABC):
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        # one lock per metric; updates come from the event loop and the inference threads
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    @abstractmethod
+    def samples(self) -> Iterator[str]:
+        ...
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}'
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [count per bucket (last is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                bound_label = 'le="' + _format_value(bound) + '"'
+                yield f'{self.name}_bucket{_format_labels(self.labels, key, bound_label)} {cumulative}'
+            yield f'{self.name}_count{_format_labels(self.labels, key)} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format"""
+        return '\n'.join(metric.render() for metric in self.metrics) + '\n'
+
+
+REGISTRY = Registry()
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    'chordcompass_http_requests_total', 'HTTP requests by route, method and status', ['route', 'method', 'status']
+))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    'chordcompass_http_request_duration_seconds', 'HTTP request latency until the last body byte, by route',
+    ['route', 'method']
+))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    'chordcompass_http_requests_in_flight', 'HTTP requests being handled, streams included'
+))
+ENGINE_STEP = REGISTRY.register(Histogram(
+    'chordcompass_engine_step_seconds',
+    'Engine wall time per generated position for the whole batch: forward, sampling and engine overhead, '
+    'not the forward alone', ['engine'], STEP_BUCKETS
+))
+GENERATION_SECONDS = REGISTRY.register(Counter(
+    'chordcompass_generation_seconds_total', 'Time spent in the generation engine', ['engine']
+))
+SAMPLED_CHORDS = REGISTRY.register(Counter(
+    'chordcompass_sampled_chords_total', 'Chords sampled; rate() of this is tokens per second', ['engine']
+))
+SAMPLED_CHORDS_PER_SECOND = REGISTRY.register(Gauge(
+    'chordcompass_sampled_chords_per_second', 'Chords per second of engine time in the last batch', ['engine']
+))
+INFERENCE_PENDING = REGISTRY.register(Gauge(
+    'chordcompass_inference_jobs_pending', 'Inference jobs running or queued on the executor'
+))
+
+
+class InstrumentedEngine:
+    """Wraps a generation engine (ChordGenerator, TransitionTable, NumpyChordGenerator) and records its timings"""
+
+    def __init__(self, engine, name: str):
+        self.engine = engine
+        self.name = name
+
+    def __getattr__(self, attribute):
+        return getattr(self.engine, attribute)
+
+    def _record(self, seconds: float, steps: int, chords: int):
+        GENERATION_SECONDS.inc(seconds, engine=self.name)
+        SAMPLED_CHORDS.inc(chords, engine=self.name)
+        if steps:
+            ENGINE_STEP.observe(seconds / steps, engine=self.name)
+        if seconds > 0:
+            SAMPLED_CHORDS_PER_SECOND.set(chords / seconds, engine=self.name)
+
+    def generate_batch(self, seed_progressions: List[List[str]], length: int = 8,
+                       temperatures: Optional[List[float]] = None, lengths: Optional[List[int]] = None):
+        start = time.perf_counter()
+        progressions = self.engine.generate_batch(seed_progressions, length=length, temperatures=temperatures,
+                                                  lengths=lengths)
+        # the batch is stepped until its longest progression is done
+        self._record(time.perf_counter() - start, max(map(len, progressions), default=0),
+                     sum(map(len, progressions)))
+        return progressions
+
+    def stream_progression(self, seed_progression: List[str], length: int = 8, temperature: float = 1.0):
+        steps = self.engine.stream_progression(seed_progression, length=length, temperature=temperature)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    step = next(steps)
+                except StopIteration:
+                    return
+                self._record(time.perf_counter() - start, 1, 1)
+                yield step
+        finally:
+            steps.close()
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route request counts, latency and in-flight requests.
+
+    Requests are labelled with their route template, so path parameters
+    cannot blow up the label set. A sample_rate share of requests, every
+    5xx and every request slower than slow_ms is logged as one JSON line
+    on the 'access' logger; headers are never logged.
+    """
+
+    def __init__(self, app, sample_rate: float = 0.0, slow_ms: float = 1000.0):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow = slow_ms / 1000.0
+        self._routes: Dict[object, str] = {}
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get('endpoint')
+        if endpoint is None:
+            return 'unmatched'
+        if endpoint not in self._routes:
+            # the router records the endpoint it matched; map it back to its path template once
+            router = scope['app'].router
+            self._routes.update({route.endpoint: route.path for route in router.routes if hasattr(route, 'endpoint')})
+        return self._routes.get(endpoint, 'unmatched')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            duration = time.perf_counter() - start
+            route, method = self._route(scope), scope['method']
+            HTTP_REQUESTS.inc(route=route, method=method, status=status)
+            HTTP_LATENCY.observe(duration, route=route, method=method)
+            if status >= 500 or duration >= self.slow or (self.sample_rate and random.random() < self.sample_rate):
+                access_logger.info(json.dumps({
+                    'method': method,
+                    'route': route,
+                    'path': scope['path'],
+                    'status': status,
+                    'duration_ms': round(duration * 1000, 3),
+                    'client': scope['client'][0] if scope.get('client') else None
+                }))
@@ -0,0 +1,144 @@
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from decoding import batch_arguments, decode_rows, step_rows
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 0.5 * (np.tanh(0.5 * x) + 1.0)
+
+
+class NumpyChordLSTM:
+    """Inference-only ChordLSTM over weights exported by export_numpy.py.
+
+    Mirrors ChordLSTM.forward/step (eval mode, so no dropout) without torch.
+    Weight matrices are used through transposed views, never copied, so
+    memory-mapped weights stay shared between processes.
+    """
+
+    def __init__(self, weights: Dict[str, np.ndarray]):
+        self.embedding = weights['embedding.weight']
+        self.layers = []
+        layer = 0
+        while f'lstm.weight_ih_l{layer}' in weights:
+            self.layers.append((
+                weights[f'lstm.weight_ih_l{layer}'].T,
+                weights[f'lstm.weight_hh_l{layer}'].T,
+                weights[f'lstm.bias_ih_l{layer}'] + weights[f'lstm.bias_hh_l{layer}']
+            ))
+            layer += 1
+        self.hidden_size = self.layers[0][1].shape[0]
+        self.chord_head = [
+            (weights['chord_head.0.weight'].T, weights['chord_head.0.bias']),
+            (weights['chord_head.2.weight'].T, weights['chord_head.2.bias'])
+        ]
+        self.duration_head = (weights['duration_head.weight'].T, weights['duration_head.bias'])
+
+    def __call__(self, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return self.forward(x)
+
+    def forward(self, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        chord_logits, duration_logits, _ = self.step(x)
+        return chord_logits, duration_logits
+
+    def step(self, x: np.ndarray, state: Optional[Tuple[np.ndarray, np.ndarray]] = None):
+        # x: (batch, steps) -> logits for the last step + (h, c) shaped like torch's (layers, batch, hidden)
+        batch, steps = x.shape
+        if state is None:
+            h = np.zeros((len(self.layers), batch, self.hidden_size), dtype=self.embedding.dtype)
+            c = np.zeros_like(h)
+        else:
+            h, c = (s.copy() for s in state)
+        layer_input = self.embedding[x]
+        hidden = self.hidden_size
+        for layer, (weight_ih, weight_hh, bias) in enumerate(self.layers):
+            # input projection for every step at once, recurrence step by step
+            projected = layer_input @ weight_ih + bias
+            outputs = np.empty((batch, steps, hidden), dtype=layer_input.dtype)
+            h_t, c_t = h[layer], c[layer]
+            for t in range(steps):
+                gates = projected[:, t] + h_t @ weight_hh
+                i = _sigmoid(gates[:, :hidden])
+                f = _sigmoid(gates[:, hidden:2 * hidden])
+                g = np.tanh(gates[:, 2 * hidden:3 * hidden])
+                o = _sigmoid(gates[:, 3 * hidden:])
+                c_t = f * c_t + i * g
+                h_t = o * np.tanh(c_t)
+                outputs[:, t] = h_t
+            h[layer], c[layer] = h_t, c_t
+            layer_input = outputs
+        last_hidden = layer_input[:, -1]
+        (w1, b1), (w2, b2) = self.chord_head
+        chord_logits = np.maximum(last_hidden @ w1 + b1, 0.0) @ w2 + b2
+        weight, bias = self.duration_head
+        duration_logits = last_hidden @ weight + bias
+        return chord_logits, duration_logits, (h, c)
+
+
+def _sample(logits: np.ndarray, temperature: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    scaled = logits / temperature
+    probs = np.exp(scaled - scaled.max(axis=1, keepdims=True))
+    cdf = np.cumsum(probs, axis=1)
+    # scale the draw instead of normalising the cdf; u < 1 keeps the index in range
+    u = rng.random(len(logits))[:, None] * cdf[:, -1:]
+    return (cdf < u).sum(axis=1)
+
+
+class NumpyChordGenerator:
+    def __init__(self, model: NumpyChordLSTM, chord_to_idx: dict):
+        self.model = model
+        self.chord_to_idx = chord_to_idx
+        self.idx_to_chord = {idx: chord for chord, idx in chord_to_idx.items()}
+
+    def stream_progression(self, seed_progression: List[str], length: int = 8, temperature: float = 1.0) -> Iterator[Tuple[str, int]]:
+        # same contract as ChordGenerator.stream_progression
+        rng = np.random.default_rng()
+        current_sequence = np.array([[self.chord_to_idx.get(chord, 0) for chord in seed_progression]], dtype=np.int64)
+        temperature = np.array([[temperature]], dtype=np.float32)
+        state = None
+        for _ in range(length):
+            chord_logits, duration_logits, state = self.model.step(current_sequence, state)
+            next_chord = _sample(chord_logits, temperature, rng)
+            next_duration = _sample(duration_logits, temperature, rng)
+            yield self.idx_to_chord[int(next_chord[0])], int(next_duration[0]) + 1
+            current_sequence = next_chord[:, None]
+
+    def generate_batch(self, seed_progressions: List[List[str]], length: int = 8, temperatures: Optional[List[float]] = None,
+                       lengths: Optional[List[int]] = None) -> List[List[Tuple[str, int]]]:
+        # same contract as ChordGenerator.generate_batch
+        temperatures, lengths, max_length = batch_arguments(len(seed_progressions), length, temperatures, lengths)
+        if max_length == 0:
+            return [[] for _ in seed_progressions]
+        rng = np.random.default_rng()
+        current_sequence = np.array(
+            [[self.chord_to_idx.get(chord, 0) for chord in seed] for seed in seed_progressions], dtype=np.int64
+        )
+        temperature = np.array(temperatures, dtype=np.float32)[:, None]
+        chord_out = np.zeros((len(seed_progressions), max_length), dtype=np.int64)
+        duration_out = np.zeros_like(chord_out)
+
+        def step(sequence, temperature, state):
+            chord_logits, duration_logits, state = self.model.step(sequence, state)
+            return _sample(chord_logits, temperature, rng), _sample(duration_logits, temperature, rng), state
+
+        for index, rows, next_chords, next_durations in step_rows(step, current_sequence, temperature, lengths, max_length):
+            chord_out[rows, index] = next_chords
+            duration_out[rows, index] = next_durations
+        return decode_rows(self.idx_to_chord, chord_out.tolist(), duration_out.tolist(), lengths)
+
+
+def load_numpy_model(weights_path: Path, mmap: bool = False) -> Tuple[NumpyChordLSTM, dict]:
+    # a .npz archive is read into memory; a directory of .npy files can be memory-mapped
+    weights_path = Path(weights_path)
+    if weights_path.is_dir():
+        weights = {
+            path.stem: np.load(path, mmap_mode='r' if mmap else None, allow_pickle=False)
+            for path in weights_path.glob('*.npy')
+        }
+    else:
+        with np.load(weights_path, allow_pickle=False) as archive:
+            weights = {name: archive[name] for name in archive.files}
+    chord_to_idx = {str(chord): idx for idx, chord in enumerate(weights.pop('vocab'))}
+    return NumpyChordLSTM(weights), chord_to_idx
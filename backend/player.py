@@ -5,6 +5,7 @@ import os
 import threading
 import logging
 from queue import Queue
+import voicing
 
 logger = logging.getLogger(__name__)
 
@@ -19,18 +20,6 @@ class ChordPlayer:
             raise FileNotFoundError(f"Soundfont not found at {self.soundfont_path}")
         logger.info(f"Using soundfont: {self.soundfont_path}")
         self.start_fluidsynth()
-        self.notes = {
-            'C': 60, 'C#': 61, 'Db': 61,
-            'D': 62, 'D#': 63, 'Eb': 63,
-            'E': 64,
-            'F': 65, 'F#': 66, 'Gb': 66,
-            'G': 67, 'G#': 68, 'Ab': 68,
-            'A': 69, 'A#': 70, 'Bb': 70,
-            'B': 71
-        }
-        self.major_triad = [0, 4, 7]
-        self.minor_triad = [0, 3, 7]
-        self.dim_triad = [0, 3, 6]
         # Playback control
         self._playback_thread = None
         self._command_queue = Queue()
@@ -125,30 +114,7 @@ class ChordPlayer:
             raise
 
     def roman_to_midi_notes(self, roman_numeral: str, tonic: str, mode: str):
-        base_midi = self.notes[tonic]
-        if mode == 'M':
-            scale_degrees = [0, 2, 4, 5, 7, 9, 11]  # Major scale
-        else:
-            scale_degrees = [0, 2, 3, 5, 7, 8, 10]  # Natural minor scale
-        numerals = ['i', 'ii', 'iii', 'iv', 'v', 'vi', 'vii'] if mode == 'm' else ['I', 'II', 'III', 'IV', 'V', 'VI',
-                                                                                   'VII']
-        degree = numerals.index(roman_numeral.upper() if mode == 'M' else roman_numeral.lower())
-        root_midi = base_midi + scale_degrees[degree]
-        if mode == 'M':
-            if roman_numeral in ['I', 'IV', 'V']:
-                intervals = self.major_triad
-            elif roman_numeral in ['ii', 'iii', 'vi']:
-                intervals = self.minor_triad
-            else:
-                intervals = self.dim_triad
-        else:
-            if roman_numeral in ['III', 'VI', 'VII']:
-                intervals = self.major_triad
-            elif roman_numeral in ['i', 'iv', 'v']:
-                intervals = self.minor_triad
-            else:
-                intervals = self.dim_triad
-        return [root_midi + interval for interval in intervals]
+        return voicing.roman_to_midi_notes(roman_numeral, tonic, mode)
 
     def _play_progression_thread(self, progression, tempo, tonic, mode):
         try:
@@ -0,0 +1,84 @@
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# one JSON object per epoch, appended by train.py
+METRICS_FILE = 'epoch_metrics.jsonl'
+
+
+def read_metrics(path: Path) -> List[Dict]:
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def plot_training_metrics(rows: List[Dict], current_epoch: int, output_dir: Path) -> Path:
+    # imported here so training never pays for matplotlib
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    rows = [row for row in rows if row['epoch'] <= current_epoch]
+    epochs = [row['epoch'] for row in rows]
+    validated = [row for row in rows if 'val_loss' in row]
+    plt.style.use('ggplot')
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 12))
+    # plot loss
+    ax1.plot(epochs, [row['loss'] for row in rows], 'b-', label='Total Loss')
+    if validated:
+        ax1.plot([row['epoch'] for row in validated], [row['val_loss'] for row in validated], 'b--', label='Validation Loss')
+    ax1.set_title('Training Loss')
+    ax1.set_xlabel('Epoch')
+    ax1.set_ylabel('Loss')
+    ax1.grid(True)
+    ax1.legend()
+    # plot chord acc
+    ax2.plot(epochs, [row['chord_accuracy'] for row in rows], 'g-', label='Chord Accuracy')
+    if validated:
+        ax2.plot([row['epoch'] for row in validated], [row['val_chord_accuracy'] for row in validated], 'g--',
+                 label='Validation Chord Accuracy')
+    ax2.set_title('Chord Prediction Accuracy')
+    ax2.set_xlabel('Epoch')
+    ax2.set_ylabel('Accuracy')
+    ax2.grid(True)
+    ax2.legend()
+    plt.tight_layout()
+    # Save plot
+    plot_path = output_dir / f'training_metrics_epoch_{current_epoch}.png'
+    plt.savefig(plot_path)
+    plt.close(fig)
+    logger.info(f'Saved training metrics: {plot_path}')
+    return plot_path
+
+
+def spawn_plot(metrics_path: Path, current_epoch: int, output_dir: Path) -> subprocess.Popen:
+    """Render the plot for current_epoch in a separate python process and return without waiting"""
+    return subprocess.Popen([
+        sys.executable, str(Path(__file__).resolve()),
+        '--metrics', str(metrics_path), '--epoch', str(current_epoch), '--output_dir', str(output_dir)
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plot training metrics from the epoch log written by train.py')
+    parser.add_argument('--metrics', type=str, default=f'checkpoints/{METRICS_FILE}', help='Epoch metrics log')
+    parser.add_argument('--epoch', type=int, default=None, help='Plot up to this epoch (default: all)')
+    parser.add_argument('--output_dir', type=str, default=None, help='Directory for the plot (default: next to the log)')
+    args = parser.parse_args()
+    metrics_path = Path(args.metrics)
+    rows = read_metrics(metrics_path)
+    if not rows:
+        raise SystemExit(f"No metrics in {metrics_path}")
+    current_epoch = args.epoch or rows[-1]['epoch']
+    plot_training_metrics(rows, current_epoch, Path(args.output_dir) if args.output_dir else metrics_path.parent)
+
+
+if __name__ == "__main__":
+    main()
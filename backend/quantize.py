@@ -0,0 +1,120 @@
+import argparse
+import copy
+import io
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import torch
+from torch import nn
+import logging
+from ChordLSTM import ChordLSTM
+from generate import ChordGenerator, load_model
+from transition_table import TransitionTable
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def quantize_model(model: ChordLSTM) -> nn.Module:
+    # dynamic int8: weights are quantized once, activations per call
+    model = copy.deepcopy(model).cpu().eval()
+    return torch.ao.quantization.quantize_dynamic(model, {nn.LSTM, nn.Linear}, dtype=torch.qint8)
+
+
+def parity_contexts(chord_to_idx: Dict[str, int], sequence_length: int, data_path: Optional[Path] = None) -> torch.Tensor:
+    """Every distinct context in the dataset, or every possible context without one"""
+    if data_path is None:
+        return torch.from_numpy(TransitionTable.all_contexts(len(chord_to_idx), sequence_length))
+    from data_loader import ChordDataset, load_dataset
+    dataset = ChordDataset(load_dataset(str(data_path)), sequence_length, chord_to_idx)
+    return torch.unique(dataset.sequences, dim=0)
+
+
+def parity_report(reference: nn.Module, quantized: nn.Module, contexts: torch.Tensor, batch_size: int = 4096) -> Dict[str, float]:
+    reference.eval()
+    quantized.eval()
+    chord_agree = duration_agree = 0
+    chord_kl = duration_kl = 0.0
+    max_chord_kl = max_duration_kl = 0.0
+    with torch.no_grad():
+        for start in range(0, len(contexts), batch_size):
+            batch = contexts[start:start + batch_size]
+            ref_chord, ref_duration = reference(batch)
+            q_chord, q_duration = quantized(batch)
+            chord_agree += (ref_chord.argmax(dim=1) == q_chord.argmax(dim=1)).sum().item()
+            duration_agree += (ref_duration.argmax(dim=1) == q_duration.argmax(dim=1)).sum().item()
+            # KL(reference || quantized) per context
+            kl_chord = (ref_chord.softmax(1) * (ref_chord.log_softmax(1) - q_chord.log_softmax(1))).sum(1)
+            kl_duration = (ref_duration.softmax(1) * (ref_duration.log_softmax(1) - q_duration.log_softmax(1))).sum(1)
+            chord_kl += kl_chord.sum().item()
+            duration_kl += kl_duration.sum().item()
+            max_chord_kl = max(max_chord_kl, kl_chord.max().item())
+            max_duration_kl = max(max_duration_kl, kl_duration.max().item())
+    count = len(contexts)
+    return {
+        "contexts": count,
+        "chord_top1_agreement": chord_agree / count,
+        "duration_top1_agreement": duration_agree / count,
+        "chord_kl_mean": chord_kl / count,
+        "duration_kl_mean": duration_kl / count,
+        "chord_kl_max": max_chord_kl,
+        "duration_kl_max": max_duration_kl
+    }
+
+
+def check_parity(report: Dict[str, float], min_agreement: float):
+    agreement = min(report["chord_top1_agreement"], report["duration_top1_agreement"])
+    if agreement < min_agreement:
+        raise RuntimeError(
+            f"Quantized model top-1 agreement {agreement:.4f} is below the required {min_agreement:.4f}: {report}"
+        )
+
+
+def serialized_size(model: nn.Module) -> int:
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+def time_generation(model: nn.Module, chord_to_idx: Dict[str, int], batch_size: int, length: int, iterations: int) -> float:
+    generator = ChordGenerator(model, torch.device('cpu'), chord_to_idx)
+    seeds = [['I', 'I']] * batch_size
+    generator.generate_batch(seeds, length=length)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        generator.generate_batch(seeds, length=length)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dynamic int8 quantization of ChordLSTM')
+    parser.add_argument('--checkpoint', type=str, default='checkpoints/final_model.pt', help='Path to model checkpoint')
+    parser.add_argument('--data_path', type=str, default=None, help='Dataset pickle for parity contexts (default: all contexts)')
+    parser.add_argument('--sequence_length', type=int, default=2, help='Context length used for parity')
+    parser.add_argument('--iterations', type=int, default=50, help='Timed iterations per configuration')
+    parser.add_argument('--threads', type=int, default=1, help='torch intra-op threads')
+    args = parser.parse_args()
+    torch.set_num_threads(args.threads)
+    model, chord_to_idx = load_model(Path(args.checkpoint), torch.device('cpu'))
+    quantized = quantize_model(model)
+    contexts = parity_contexts(chord_to_idx, args.sequence_length, Path(args.data_path) if args.data_path else None)
+    report = parity_report(model, quantized, contexts)
+    print("\nParity (fp32 vs int8):")
+    for key, value in report.items():
+        print(f"  {key:<24} {value:.6g}")
+    # weight memory is the serialized state_dict; process RSS is dominated by the torch runtime
+    sizes = {'fp32': serialized_size(model), 'int8': serialized_size(quantized)}
+    print(f"\nWeights: fp32 {sizes['fp32'] / 1024:.0f}KB, int8 {sizes['int8'] / 1024:.0f}KB "
+          f"({sizes['fp32'] / sizes['int8']:.1f}x smaller)")
+    print(f"\n{'mode':<6} {'weights':>10} {'1x8 ms':>10} {'32x8 ms':>10} {'64x32 ms':>10}")
+    for name, candidate in (('fp32', model), ('int8', quantized)):
+        timings = [
+            time_generation(candidate, chord_to_idx, batch_size, length, args.iterations) * 1000
+            for batch_size, length in ((1, 8), (32, 8), (64, 32))
+        ]
+        print(f"{name:<6} {sizes[name] / 1024:>8.0f}KB " + " ".join(f"{t:>10.2f}" for t in timings))
+
+
+if __name__ == "__main__":
+    main()
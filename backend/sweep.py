@@ -0,0 +1,228 @@
+import argparse
+import csv
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+import torch
+import logging
+from ChordLSTM import ChordLSTM
+from data_loader import BatchLoader, ChordDataset, SequenceChunks, create_chord_vocabulary, load_cached_dataset
+from train import ChordTrainer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# hyperparameters a spec may vary, with the train.py defaults
+DEFAULTS = {
+    'hidden_dim': 64,
+    'sequence_length': 3,
+    'batch_size': 32,
+    'objective': 'window',
+    'chunk_length': 32,
+    'precision': 'fp32'
+}
+SHARED_ARRAYS = ['tokens', 'durations', 'boundaries']
+# val_* come from held-out pieces; train_* are running means over the last epoch, so they favour overfit trials
+METRICS = ['val_loss', 'val_chord_accuracy', 'val_duration_accuracy', 'train_loss', 'train_chord_accuracy',
+           'train_duration_accuracy']
+
+# per-process state, set by _init_worker
+_shared = {}
+
+
+def expand_spec(spec: Dict) -> List[Dict]:
+    """Trial parameter sets for a grid or random search spec.
+
+    {"method": "grid", "params": {"hidden_dim": [32, 64], "batch_size": [32, 64]}}
+    {"method": "random", "num_trials": 8, "seed": 0, "params": {...}}
+    Random search samples distinct points of the same grid.
+    """
+    unknown = set(spec['params']) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters {sorted(unknown)}; supported: {sorted(DEFAULTS)}")
+    names = list(spec['params'])
+    grid = [dict(zip(names, values)) for values in itertools.product(*(spec['params'][name] for name in names))]
+    method = spec.get('method', 'grid')
+    if method == 'random':
+        grid = random.Random(spec.get('seed', 0)).sample(grid, min(spec.get('num_trials', len(grid)), len(grid)))
+    elif method != 'grid':
+        raise ValueError(f"Unknown sweep method: {method}")
+    return [{**DEFAULTS, **params} for params in grid]
+
+
+def share_arrays(arrays: Dict[str, np.ndarray]) -> Tuple[List[SharedMemory], Dict[str, Tuple[str, tuple, str]]]:
+    # one shared block per array; workers get (name, shape, dtype) and map the same pages
+    blocks, specs = [], {}
+    for name, array in arrays.items():
+        block = SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+        blocks.append(block)
+        specs[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+
+def _init_worker(specs: Dict[str, Tuple[str, tuple, str]], threads: int):
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+    for name, (block_name, shape, dtype) in specs.items():
+        # spawned workers share the parent's resource tracker, and the parent unlinks the blocks
+        block = SharedMemory(name=block_name)
+        _shared[name] = (block, np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf))
+
+
+def run_trial(trial: int, params: Dict, num_epochs: int, output_dir: Path, chord_to_idx: Dict[str, int],
+              seed: int, val_fraction: float) -> Dict:
+    torch.manual_seed(seed + trial)
+    tokens, durations, boundaries = (_shared[name][1] for name in SHARED_ARRAYS)
+    dataset = ChordDataset.from_arrays(tokens, durations, boundaries, params['sequence_length'])
+    val_dataset = None
+    if val_fraction > 0:
+        # the base seed, not the trial's, so every trial holds out the same pieces
+        dataset, val_dataset = dataset.split_pieces(val_fraction, seed=seed)
+    if params['objective'] == 'sequence':
+        dataset = SequenceChunks(dataset, params['chunk_length'] or None)
+        if val_dataset is not None:
+            val_dataset = SequenceChunks(val_dataset, params['chunk_length'] or None)
+    model = ChordLSTM(vocab_size=len(chord_to_idx), hidden_dim=params['hidden_dim'])
+    trainer = ChordTrainer(model, torch.device('cpu'), precision=params['precision'], objective=params['objective'])
+    loader = BatchLoader(dataset, batch_size=params['batch_size'], bucket_by_length=params['objective'] == 'sequence')
+    start = time.perf_counter()
+    for _ in range(num_epochs):
+        loss, chord_acc, duration_acc = trainer.train_epoch(loader)
+    seconds = time.perf_counter() - start
+    result = {
+        'trial': trial,
+        **params,
+        'train_loss': loss,
+        'train_chord_accuracy': chord_acc,
+        'train_duration_accuracy': duration_acc
+    }
+    if val_dataset is not None and len(val_dataset) > 0:
+        val_loader = BatchLoader(val_dataset, batch_size=1024, shuffle=False,
+                                 bucket_by_length=params['objective'] == 'sequence')
+        val_loss, val_chord_acc, val_duration_acc = trainer.evaluate(val_loader)
+    else:
+        # too few pieces to hold any out for this trial's windows
+        val_loss = val_chord_acc = val_duration_acc = float('nan')
+    result.update(val_loss=val_loss, val_chord_accuracy=val_chord_acc, val_duration_accuracy=val_duration_acc)
+    checkpoint = output_dir / f"trial_{trial:03d}.pt"
+    trainer.save_checkpoint(checkpoint, num_epochs, chord_to_idx, config=params)
+    result.update(seconds=seconds, checkpoint=str(checkpoint))
+    return result
+
+
+def run_sweep(trials: List[Dict], arrays: Dict[str, np.ndarray], chord_to_idx: Dict[str, int], output_dir: Path,
+              num_epochs: int, workers: int, threads: int, keep_best: int, metric: str, seed: int = 0,
+              val_fraction: float = 0.1) -> List[Dict]:
+    """Run every trial on a process pool and keep the keep_best checkpoints by metric"""
+    if metric.startswith('val_') and val_fraction <= 0:
+        raise ValueError(f"--metric {metric} needs a validation split; set --val_fraction or rank on a train_* metric")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    # lower is better for the losses, higher for the accuracies; trials without a score rank last
+    sign = 1 if metric.endswith('loss') else -1
+
+    def rank(row: Dict) -> Tuple[bool, float]:
+        return math.isnan(row[metric]), sign * row[metric]
+
+    # inherited by the spawned workers before they import torch
+    os.environ['OMP_NUM_THREADS'] = os.environ['MKL_NUM_THREADS'] = str(threads)
+    blocks, specs = share_arrays(arrays)
+    results = []
+    try:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(specs, threads)) as pool:
+            futures = [
+                pool.submit(run_trial, trial, params, num_epochs, output_dir, chord_to_idx, seed, val_fraction)
+                for trial, params in enumerate(trials)
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                logger.info(
+                    f"Trial {result['trial']} ({len(results)}/{len(trials)}) "
+                    f"{metric}: {result[metric]:.4f} in {result['seconds']:.1f}s"
+                )
+                # drop checkpoints as soon as they fall out of the top keep_best
+                results.sort(key=rank)
+                for row in results[keep_best:]:
+                    if row['checkpoint']:
+                        Path(row['checkpoint']).unlink(missing_ok=True)
+                        row['checkpoint'] = ''
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return results
+
+
+def write_results(results: List[Dict], path: Path):
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a hyperparameter sweep of ChordLSTM training')
+    parser.add_argument('--data_path', type=str, default='dataset.pkl', help='Path to dataset pickle file')
+    parser.add_argument('--cache_dir', type=str, default='cache/', help='Directory for compiled, memory-mapped datasets')
+    parser.add_argument('--spec', type=str, required=True, help='Sweep spec as a JSON file or inline JSON')
+    parser.add_argument('--output_dir', type=str, default='sweep/', help='Directory for results and kept checkpoints')
+    parser.add_argument('--num_epochs', type=int, default=25, help='Epochs per trial')
+    parser.add_argument('--workers', type=int, default=None, help='Concurrent trials (default: cores / threads)')
+    parser.add_argument('--threads', type=int, default=1, help='torch threads per trial')
+    parser.add_argument('--keep_best', type=int, default=3, help='Checkpoints to keep')
+    parser.add_argument('--val_fraction', type=float, default=0.1,
+                        help='Share of pieces held out, the same pieces for every trial (0: train_* metrics only)')
+    parser.add_argument('--metric', type=str, default='val_loss', choices=METRICS,
+                        help='Metric that ranks trials: val_* on the held-out pieces after the last epoch, '
+                             'train_* as the running mean over the last training epoch')
+    parser.add_argument('--seed', type=int, default=0, help='Base random seed; trial i uses seed + i')
+    args = parser.parse_args()
+    if args.metric.startswith('val_') and args.val_fraction <= 0:
+        parser.error(f"--metric {args.metric} needs --val_fraction > 0")
+    spec = json.loads(Path(args.spec).read_text() if os.path.exists(args.spec) else args.spec)
+    trials = expand_spec(spec)
+    workers = args.workers or max(1, (os.cpu_count() or 1) // args.threads)
+    chord_to_idx = {chord: idx for idx, chord in enumerate(create_chord_vocabulary())}
+    # token streams do not depend on sequence_length, so every trial shares one copy
+    dataset = load_cached_dataset(Path(args.data_path), DEFAULTS['sequence_length'], chord_to_idx, Path(args.cache_dir))
+    arrays = {
+        'tokens': dataset.tokens.numpy(),
+        'durations': dataset.durations.numpy(),
+        'boundaries': dataset.boundaries.numpy()
+    }
+    logger.info(f"Running {len(trials)} trials on {workers} worker(s) x {args.threads} thread(s)")
+    output_dir = Path(args.output_dir)
+    start = time.perf_counter()
+    results = run_sweep(trials, arrays, chord_to_idx, output_dir, args.num_epochs, workers, args.threads,
+                        args.keep_best, args.metric, seed=args.seed, val_fraction=args.val_fraction)
+    elapsed = time.perf_counter() - start
+    write_results(results, output_dir / 'results.csv')
+    varied = list(spec['params'])
+    print(f"\n{'trial':>5} " + " ".join(f"{name:>15}" for name in varied) + " "
+          + " ".join(f"{name:>{len(name)}}" for name in METRICS) + f" {'seconds':>8}  checkpoint")
+    for row in results:
+        print(f"{row['trial']:>5} " + " ".join(f"{str(row[name]):>15}" for name in varied) + " "
+              + " ".join(f"{row[name]:>{len(name)}.4f}" for name in METRICS) + f" {row['seconds']:>8.1f}  {row['checkpoint']}")
+    trial_seconds = sum(row['seconds'] for row in results)
+    print(f"\nSweep took {elapsed:.1f}s for {trial_seconds:.1f}s of training ({trial_seconds / elapsed:.2f}x)")
+    print(f"Results written to {output_dir / 'results.csv'}")
+
+
+if __name__ == "__main__":
+    main()
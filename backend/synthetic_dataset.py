@@ -0,0 +1,58 @@
+import argparse
+import pickle
+from pathlib import Path
+
+import numpy as np
+import logging
+from data_loader import MAJOR_SCALE, MINOR_SCALE
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# frames per bar in the 'root' lists of dataset.pkl
+BAR_LENGTH = 8
+# the duration head predicts 1..8 frames
+MAX_DURATION = 8
+
+
+def synthetic_pieces(num_pieces: int, min_chords: int = 8, max_chords: int = 64, seed: int = 0) -> dict:
+    """Random diatonic pieces in the dataset.pkl layout, for benchmarks on corpora of any size.
+
+    Each piece is a random walk over scale degrees in a random key and mode,
+    with chord durations of 1..MAX_DURATION frames split into bars.
+    """
+    rng = np.random.default_rng(seed)
+    pieces = {}
+    for i in range(num_pieces):
+        tonic = int(rng.integers(12))
+        mode = 'M' if rng.random() < 0.5 else 'm'
+        scale = MAJOR_SCALE if mode == 'M' else MINOR_SCALE
+        num_chords = int(rng.integers(min_chords, max_chords + 1))
+        # neighbouring chords always differ, so every chord stays one run
+        degrees = np.cumsum(rng.integers(1, len(scale), size=num_chords)) % len(scale)
+        roots = (tonic + np.asarray(scale)[degrees]) % 12
+        frames = np.repeat(roots, rng.integers(1, MAX_DURATION + 1, size=num_chords)).tolist()
+        pieces[f'piece{i}'] = {
+            'root': [frames[start:start + BAR_LENGTH] for start in range(0, len(frames), BAR_LENGTH)],
+            'tonic': tonic,
+            'mode': mode
+        }
+    return pieces
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a random corpus in the dataset.pkl format')
+    parser.add_argument('--output', type=str, default='synthetic.pkl', help='Output pickle file')
+    parser.add_argument('--num_pieces', type=int, default=100000, help='Number of pieces')
+    parser.add_argument('--min_chords', type=int, default=8, help='Fewest chords per piece')
+    parser.add_argument('--max_chords', type=int, default=64, help='Most chords per piece')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+    pieces = synthetic_pieces(args.num_pieces, args.min_chords, args.max_chords, args.seed)
+    with open(Path(args.output), 'wb') as file:
+        pickle.dump(pieces, file)
+    logger.info(f"Wrote {len(pieces)} pieces to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import pytest
+
+pytest.importorskip('httpx')
+from fastapi.testclient import TestClient
+
+from benchmarks.common import import_server
+
+
+@pytest.fixture(scope='module')
+def client(tmp_path_factory):
+    main = import_server(tmp_path_factory.mktemp('checkpoint'))
+    # the context manager runs the startup and shutdown handlers
+    with TestClient(main.app) as client:
+        yield client
+
+
+def test_generate_batch_accepts_max_progressions(client):
+    response = client.post('/generate_batch', json={'num_progressions': 64, 'length': 4})
+    assert response.status_code == 200
+    assert [len(progression['chords']) for progression in response.json()['progressions']] == [4] * 64
+
+
+@pytest.mark.parametrize('body', [
+    {'num_progressions': 0},
+    {'num_progressions': 65},
+    {'num_progressions': 2, 'length': -1},
+    {'num_progressions': 2, 'temperatures': [1.0, 0.0]}
+])
+def test_generate_batch_rejects_bad_input(client, body):
+    assert client.post('/generate_batch', json=body).status_code == 422
@@ -0,0 +1,27 @@
+import asyncio
+
+from batcher import GenerationBatcher
+from inference import InferenceExecutor
+from test_generate_batch import ENGINES
+
+
+def test_bad_temperature_fails_only_its_own_request():
+    async def run():
+        executor = InferenceExecutor(set_torch_threads=False)
+        executor.start()
+        batcher = GenerationBatcher(ENGINES['numpy'], executor, window_ms=50.0)
+        batcher.start()
+        try:
+            return await asyncio.gather(
+                batcher.submit(['I', 'I'], 4, 1.0),
+                batcher.submit(['I', 'I'], 4, 0.0),
+                batcher.submit(['I', 'I'], 3, 0.5),
+                return_exceptions=True
+            )
+        finally:
+            await batcher.stop()
+            executor.shutdown()
+
+    good, bad, other = asyncio.run(run())
+    assert isinstance(bad, ValueError)
+    assert [len(good), len(other)] == [4, 3]
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+import torch
+
+from ChordLSTM import ChordLSTM
+from generate import ChordGenerator
+from numpy_lstm import NumpyChordGenerator, NumpyChordLSTM
+from transition_table import TransitionTable
+
+CHORD_TO_IDX = {chord: idx for idx, chord in enumerate(['I', 'ii', 'iii', 'IV', 'V', 'vi'])}
+
+
+def _engines():
+    torch.manual_seed(0)
+    model = ChordLSTM(vocab_size=len(CHORD_TO_IDX), hidden_dim=8).eval()
+    weights = {name: tensor.numpy() for name, tensor in model.state_dict().items()}
+    return {
+        'torch': ChordGenerator(model, torch.device('cpu'), CHORD_TO_IDX),
+        'numpy': NumpyChordGenerator(NumpyChordLSTM(weights), CHORD_TO_IDX),
+        'table': TransitionTable.from_model(model, CHORD_TO_IDX, 2, torch.device('cpu'))
+    }
+
+
+ENGINES = _engines()
+
+
+@pytest.fixture(params=sorted(ENGINES))
+def engine(request):
+    return ENGINES[request.param]
+
+
+def test_each_row_gets_its_own_length(engine):
+    progressions = engine.generate_batch([['I', 'I']] * 3, temperatures=[0.5, 1.0, 2.0], lengths=[8, 0, 3])
+    assert [len(progression) for progression in progressions] == [8, 0, 3]
+
+
+def test_negative_lengths_are_empty(engine):
+    progressions = engine.generate_batch([['I', 'I']] * 2, lengths=[-1, 8])
+    assert [len(progression) for progression in progressions] == [0, 8]
+    assert engine.generate_batch([['I', 'I']], lengths=[-1]) == [[]]
+
+
+@pytest.mark.parametrize('temperature', [0.0, -1.0, float('nan')])
+def test_non_positive_temperature_is_rejected(engine, temperature):
+    with pytest.raises(ValueError):
+        engine.generate_batch([['I', 'I']] * 2, temperatures=[1.0, temperature])
@@ -0,0 +1,29 @@
+import pytest
+
+from data_loader import create_chord_vocabulary
+from ingest_csv import normalize_numeral
+
+CHORD_TO_IDX = {chord: idx for idx, chord in enumerate(create_chord_vocabulary())}
+IDX_TO_CHORD = {idx: chord for chord, idx in CHORD_TO_IDX.items()}
+
+
+@pytest.mark.parametrize('numeral, chord, resolution', [
+    ('V', 'V', 'exact'),
+    ('vii°', 'vii°', 'exact'),
+    # minor-mode vocabulary tokens are read as major-key degrees, like every other CSV numeral
+    ('v', 'V', 'mapped'),
+    ('III', 'iii', 'mapped'),
+    ('VI', 'vi', 'mapped'),
+    ('VII', 'vii°', 'mapped'),
+    ('II', 'ii', 'mapped'),
+    ('VI#', 'vi', 'mapped'),
+])
+def test_numerals_use_major_key_degrees(numeral, chord, resolution):
+    idx, resolved = normalize_numeral(numeral, CHORD_TO_IDX, 'degree')
+    assert (IDX_TO_CHORD[idx], resolved) == (chord, resolution)
+
+
+def test_minor_mode_token_is_not_an_exact_match():
+    assert normalize_numeral('III', CHORD_TO_IDX, 'skip') == (None, 'oov')
+    with pytest.raises(ValueError):
+        normalize_numeral('v', CHORD_TO_IDX, 'error')
@@ -0,0 +1,46 @@
+import pytest
+import torch
+
+from ChordLSTM import ChordLSTM
+
+VOCAB_SIZE = 14
+WINDOW = 6
+
+
+@pytest.fixture
+def model():
+    torch.manual_seed(0)
+    return ChordLSTM(vocab_size=VOCAB_SIZE, hidden_dim=16).eval()
+
+
+@pytest.fixture
+def window():
+    generator = torch.Generator().manual_seed(1)
+    return torch.randint(0, VOCAB_SIZE, (4, WINDOW), generator=generator)
+
+
+def _step_in_chunks(model, window, chunk):
+    state = None
+    for start in range(0, window.shape[1], chunk):
+        chord_logits, duration_logits, state = model.step(window[:, start:start + chunk], state)
+    return chord_logits, duration_logits
+
+
+@pytest.mark.parametrize('chunk', [1, 2, 4, WINDOW])
+def test_step_matches_forward(model, window, chunk):
+    with torch.no_grad():
+        chord_expected, duration_expected = model(window)
+        chord_logits, duration_logits = _step_in_chunks(model, window, chunk)
+    torch.testing.assert_close(chord_logits, chord_expected, rtol=1e-5, atol=1e-5)
+    torch.testing.assert_close(duration_logits, duration_expected, rtol=1e-5, atol=1e-5)
+
+
+def test_step_matches_forward_distributions(model, window):
+    # the sampling path feeds one token per step after the seed
+    with torch.no_grad():
+        chord_expected, duration_expected = model(window)
+        chord_logits, duration_logits, state = model.step(window[:, :2])
+        for position in range(2, WINDOW):
+            chord_logits, duration_logits, state = model.step(window[:, position:position + 1], state)
+    for logits, expected in ((chord_logits, chord_expected), (duration_logits, duration_expected)):
+        torch.testing.assert_close(torch.softmax(logits, dim=1), torch.softmax(expected, dim=1), rtol=0, atol=1e-6)
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+import torch
+
+from ChordLSTM import ChordLSTM
+from numpy_lstm import NumpyChordLSTM
+from transition_table import TransitionTable
+
+CHORD_TO_IDX = {chord: idx for idx, chord in enumerate(['I', 'ii', 'iii', 'IV', 'V', 'vi', 'vii°'])}
+SEQUENCE_LENGTH = 2
+
+
+@pytest.fixture(scope='module')
+def model():
+    torch.manual_seed(0)
+    return ChordLSTM(vocab_size=len(CHORD_TO_IDX), hidden_dim=16).eval()
+
+
+def test_table_matches_stepwise_torch_model(model):
+    table = TransitionTable.from_model(model, CHORD_TO_IDX, SEQUENCE_LENGTH, torch.device('cpu'))
+    assert table.chord_logits.shape == (len(CHORD_TO_IDX) ** SEQUENCE_LENGTH, len(CHORD_TO_IDX))
+    assert table.max_error(model, torch.device('cpu')) < 1e-5
+
+
+def test_table_matches_stepwise_numpy_model(model):
+    numpy_model = NumpyChordLSTM({name: tensor.numpy() for name, tensor in model.state_dict().items()})
+    table = TransitionTable.from_model(numpy_model, CHORD_TO_IDX, SEQUENCE_LENGTH)
+    assert table.max_error(numpy_model) < 1e-5
+
+
+def test_context_indexes_the_seed_window(model):
+    table = TransitionTable.from_model(model, CHORD_TO_IDX, SEQUENCE_LENGTH, torch.device('cpu'))
+    seed = ['vi', 'IV']
+    with torch.no_grad():
+        chord_logits, duration_logits = model(torch.tensor([[CHORD_TO_IDX[chord] for chord in seed]]))
+    context = table._context(['I', 'V'] + seed)
+    np.testing.assert_allclose(table.chord_logits[context], chord_logits[0].numpy(), rtol=1e-5, atol=1e-5)
+    np.testing.assert_allclose(table.duration_logits[context], duration_logits[0].numpy(), rtol=1e-5, atol=1e-5)
@@ -1,181 +1,545 @@
 import argparse
+import json
+import os
+import socket
+import time
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
-from typing import Tuple, Dict, List
-import matplotlib.pyplot as plt
-import numpy as np
+from typing import Tuple, Dict, List, Optional
 
 import torch
+import torch.distributed as dist
 from torch import nn
+from torch.nn.parallel import DistributedDataParallel
 from torch.utils.data import DataLoader
+from torch.utils.data.distributed import DistributedSampler
+from torch.nn.utils.rnn import pack_padded_sequence
 import logging
-from data_loader import load_dataset, create_chord_vocabulary, ChordDataset
+from data_loader import (
+    load_dataset, load_cached_dataset, load_compiled_dataset, create_chord_vocabulary, ChordDataset, BatchLoader,
+    SequenceChunks, IGNORE_INDEX
+)
 from ChordLSTM import ChordLSTM
+from checkpointing import CheckpointWriter, atomic_save, snapshot
+from instrumentation import PHASES, StepLog, make_profiler, parse_step_range, peak_memory_mb, summarize_steps, synchronize
+from plot_metrics import METRICS_FILE, spawn_plot
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def plot_training_metrics(losses: List[float],
-                         accuracies: List[float],
-                         duration_accuracies: List[float],  # Changed from mses
-                         current_epoch: int,
-                         output_dir: Path):
-    plt.style.use('ggplot')
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 12))
-    epochs = np.arange(1, len(losses) + 1)
-    # plot loss
-    ax1.plot(epochs, losses, 'b-', label='Total Loss')
-    ax1.set_title('Training Loss')
-    ax1.set_xlabel('Epoch')
-    ax1.set_ylabel('Loss')
-    ax1.grid(True)
-    ax1.legend()
-    # plot chord acc
-    ax2.plot(epochs, accuracies, 'g-', label='Chord Accuracy')
-    ax2.set_title('Chord Prediction Accuracy')
-    ax2.set_xlabel('Epoch')
-    ax2.set_ylabel('Accuracy')
-    ax2.grid(True)
-    ax2.legend()
-    plt.tight_layout()
-    # Save plot
-    plot_path = output_dir / f'training_metrics_epoch_{current_epoch}.png'
-    print(f'Saved training metrics: {plot_path}')
-    plt.savefig(plot_path)
-    plt.close()
+_NO_PHASE = nullcontext()
+# one JSON object per training step, with --step_metrics
+STEP_METRICS_FILE = 'step_metrics.jsonl'
+
+
+class ObjectiveForward(nn.Module):
+    """Training forward pass for each objective, as one module so DDP and torch.compile can wrap it"""
+
+    def __init__(self, model: ChordLSTM, objective: str = 'window', packed: bool = False):
+        super().__init__()
+        self.model = model
+        self.objective = objective
+        self.packed = packed
+
+    def forward(self, x: torch.Tensor, lengths: Optional[torch.Tensor] = None) -> Tuple[torch.Tensor, torch.Tensor]:
+        if self.objective == 'sequence' and self.packed:
+            # real steps only, in PackedSequence order
+            return self.model.forward_packed(x, lengths)
+        if self.objective == 'sequence':
+            # every (chunk, step) is one sample; padded steps carry IGNORE_INDEX targets
+            chord_logits, duration_logits, _ = self.model.forward_sequence(x)
+            return chord_logits.flatten(0, 1), duration_logits.flatten(0, 1)
+        return self.model(x)
 
 
 class ChordTrainer:
-    def __init__(self, model: ChordLSTM, device: torch.device):
+    def __init__(self, model: ChordLSTM, device: torch.device, compile_model: bool = False, precision: str = 'fp32',
+                 log_every: int = 0, objective: str = 'window', packed: bool = False, distributed: bool = False,
+                 checkpoint_writer: Optional[CheckpointWriter] = None, step_log: Optional[StepLog] = None):
         self.model = model
         self.device = device
+        # window: one target after each window; sequence: teacher-forced targets at every step of a chunk
+        self.objective = objective
+        # sequence objective only: run the LSTM over packed chunks so padding costs nothing
+        self.packed = packed
+        self.distributed = distributed
+        # DDP and compile wrap the training forward; checkpoints still come from the plain module
+        self.forward_model = ObjectiveForward(model, objective, packed)
+        self.train_model = self.forward_model
+        if distributed:
+            self.train_model = DistributedDataParallel(self.train_model)
+        if compile_model:
+            self.train_model = torch.compile(self.train_model)
+        # writes checkpoints in the background when set, otherwise save_checkpoint blocks
+        self.checkpoint_writer = checkpoint_writer
+        # per-step phase timings go to step_log; profiler is set by the caller while a trace is recorded
+        self.step_log = step_log
+        self.profiler: Optional[torch.profiler.profile] = None
+        self.profile_end = 0
+        self.phase_times = {}
+        self.global_step = 0
+        if precision == 'bf16' and device.type != 'cpu':
+            # only cpu bf16 autocast has been measured; refuse it elsewhere rather than autocast on mps silently
+            raise ValueError(f"--precision bf16 is only supported on the cpu, not {device.type}")
+        self.autocast_dtype = torch.bfloat16 if precision == 'bf16' else None
+        # read metrics back from the device every log_every steps, or only once per epoch when 0
+        self.log_every = log_every
         self.chord_criterion = nn.CrossEntropyLoss()
         self.duration_criterion = nn.CrossEntropyLoss()
         self.optimizer = torch.optim.Adam(model.parameters(), lr=0.001)
+        # stepped on the validation loss by the caller
         self.scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(
-            self.optimizer, mode='max', factor=0.5, patience=5
+            self.optimizer, mode='min', factor=0.5, patience=5
         )
         # track metrics
         self.losses = []
         self.accuracies = []
         self.duration_accuracies = []
+        self.val_losses = []
+        self.val_accuracies = []
+        self.padding_waste: Optional[float] = None
 
-    def train_epoch(self, dataloader: DataLoader) -> Tuple[float, float, float]:
-        self.model.train()
-        total_loss = 0
-        chord_accuracy = 0
-        duration_accuracy = 0
-        for batch_sequences, batch_chord_targets, batch_duration_targets in dataloader:
-            batch_sequences = batch_sequences.to(self.device)
-            batch_chord_targets = batch_chord_targets.to(self.device)
-            batch_duration_targets = (batch_duration_targets - 1).long().to(self.device)
-            self.optimizer.zero_grad()
-            chord_logits, duration_logits = self.model(batch_sequences)  #
+    def _prepare_batch(self, batch: Tuple[torch.Tensor, ...]) -> Tuple[torch.Tensor, ...]:
+        # SequenceChunks batches also carry the chunk lengths, which stay on the cpu for packing
+        batch_sequences, batch_chord_targets, batch_duration_targets, *lengths = batch
+        batch_sequences = batch_sequences.to(self.device, non_blocking=True)
+        batch_chord_targets = batch_chord_targets.to(self.device, non_blocking=True)
+        # durations start at 1, classes at 0
+        batch_duration_targets = torch.where(
+            batch_duration_targets == IGNORE_INDEX, batch_duration_targets, batch_duration_targets - 1
+        ).long().to(self.device, non_blocking=True)
+        return batch_sequences, batch_chord_targets, batch_duration_targets, lengths[0] if lengths else None
+
+    def _loss(self, forward: nn.Module, batch_sequences: torch.Tensor, batch_chord_targets: torch.Tensor,
+              batch_duration_targets: torch.Tensor, lengths: Optional[torch.Tensor]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Combined loss, and (loss, correct chords, correct durations, targets) as one tensor on the device"""
+        with torch.autocast(self.device.type, dtype=self.autocast_dtype, enabled=self.autocast_dtype is not None):
+            chord_logits, duration_logits = forward(batch_sequences, lengths)
+            if self.objective == 'sequence' and self.packed:
+                # line the targets up with the packed logits
+                batch_chord_targets, batch_duration_targets = (
+                    pack_padded_sequence(targets, lengths, batch_first=True, enforce_sorted=False).data
+                    for targets in (batch_chord_targets, batch_duration_targets)
+                )
+            elif self.objective == 'sequence':
+                batch_chord_targets, batch_duration_targets = batch_chord_targets.flatten(), batch_duration_targets.flatten()
             # get loss
             chord_loss = self.chord_criterion(chord_logits, batch_chord_targets)
             duration_loss = self.duration_criterion(duration_logits, batch_duration_targets)
             combined_loss = chord_loss + duration_loss
-            # backprop
+        # calc acc without leaving the device
+        chord_pred = torch.argmax(chord_logits, dim=1)
+        duration_pred = torch.argmax(duration_logits, dim=1)
+        valid = batch_chord_targets != IGNORE_INDEX
+        return combined_loss, torch.stack([
+            combined_loss.detach().float(),
+            ((chord_pred == batch_chord_targets) & valid).sum().float(),
+            ((duration_pred == batch_duration_targets) & valid).sum().float(),
+            valid.sum().float()
+        ])
+
+    def train_step(self, batch_sequences: torch.Tensor, batch_chord_targets: torch.Tensor,
+                   batch_duration_targets: torch.Tensor, lengths: Optional[torch.Tensor] = None) -> torch.Tensor:
+        """One optimizer step; returns (loss, chord accuracy, duration accuracy) as a tensor on the device"""
+        with self._phase('optimizer'):
+            self.optimizer.zero_grad()
+        with self._phase('forward'):
+            combined_loss, stats = self._loss(
+                self.train_model, batch_sequences, batch_chord_targets, batch_duration_targets, lengths
+            )
+        # backprop
+        with self._phase('backward'):
             combined_loss.backward()
+        with self._phase('optimizer'):
             self.optimizer.step()
-            total_loss += combined_loss.item()
-            # calc acc
-            chord_pred = torch.argmax(chord_logits, dim=1)
-            duration_pred = torch.argmax(duration_logits, dim=1)
-            chord_accuracy += (chord_pred == batch_chord_targets).float().mean().item()
-            duration_accuracy += (duration_pred == batch_duration_targets).float().mean().item()
-        # get batches
-        num_batches = len(dataloader)
-        # metrics
-        avg_loss = total_loss / num_batches
-        avg_chord_accuracy = chord_accuracy / num_batches
-        avg_duration_accuracy = duration_accuracy / num_batches
+        count = stats[3].clamp(min=1)
+        return torch.stack([stats[0], stats[1] / count, stats[2] / count])
+
+    @property
+    def instrumented(self) -> bool:
+        return self.step_log is not None or self.profiler is not None
+
+    def _phase(self, name: str):
+        # a shared no-op context unless timing or profiling, so the default path adds nothing
+        return self._timed_phase(name) if self.instrumented else _NO_PHASE
+
+    @contextmanager
+    def _timed_phase(self, name: str):
+        with torch.profiler.record_function(name) if self.profiler is not None else _NO_PHASE:
+            synchronize(self.device)
+            start = time.perf_counter()
+            yield
+            synchronize(self.device)
+            self.phase_times[name] = self.phase_times.get(name, 0.0) + time.perf_counter() - start
+
+    def start_profiler(self, start: int, end: int, trace_path: Path):
+        """Profile training steps [start, end) of this run and write them to trace_path as a Chrome trace"""
+        self.profiler = make_profiler(start, end, trace_path, self.device)
+        self.profile_end = end
+        self.profiler.start()
+
+    def _end_step(self, batch_size: int):
+        if self.step_log is not None:
+            step_time = sum(self.phase_times.values())
+            row = {'step': self.global_step, **{phase: self.phase_times.get(phase, 0.0) for phase in PHASES}}
+            row.update(
+                step_time=step_time,
+                samples=batch_size,
+                samples_per_second=batch_size / step_time if step_time else 0.0,
+                peak_memory_mb=peak_memory_mb(self.device)
+            )
+            self.step_log.write(row)
+        self.phase_times = {}
+        if self.profiler is not None:
+            self.profiler.step()
+            if self.global_step >= self.profile_end:
+                self.profiler.stop()
+                self.profiler = None
+
+    def train_epoch(self, dataloader: DataLoader) -> Tuple[float, float, float]:
+        self.train_model.train()
+        # running sums of (loss, chord accuracy, duration accuracy), only synced when read
+        totals = torch.zeros(3, device=self.device)
+        num_batches = 0
+        # batch positions and real steps of the padded batches this epoch actually ran; lengths live on the cpu
+        padded_positions = used_positions = 0
+        # data wait is the time from the end of one step to the start of the next
+        step_end = time.perf_counter()
+        for batch in dataloader:
+            if self.instrumented:
+                self.phase_times['data'] = time.perf_counter() - step_end
+            with self._phase('data'):
+                batch = self._prepare_batch(batch)
+            if batch[3] is not None:
+                padded_positions += batch[0].numel()
+                used_positions += int(batch[3].sum())
+            totals += self.train_step(*batch)
+            self.global_step += 1
+            if self.instrumented:
+                self._end_step(len(batch[0]))
+                step_end = time.perf_counter()
+            num_batches += 1
+            if self.log_every and num_batches % self.log_every == 0:
+                loss, chord_acc, duration_acc = (totals / num_batches).tolist()
+                logger.info(
+                    f"  step {num_batches}/{len(dataloader)} "
+                    f"Loss: {loss:.4f} Chord Accuracy: {chord_acc:.4f} Duration Accuracy: {duration_acc:.4f}"
+                )
+        if self.distributed:
+            # every rank runs the same number of steps, so the mean of the rank means is the global mean
+            dist.all_reduce(totals)
+            totals /= dist.get_world_size()
+        # metrics, one host sync per epoch
+        avg_loss, avg_chord_accuracy, avg_duration_accuracy = (totals / max(num_batches, 1)).tolist()
         # add to lists
         self.losses.append(avg_loss)
         self.accuracies.append(avg_chord_accuracy)
         self.duration_accuracies.append(avg_duration_accuracy)  # Changed from mses
+        # share of padded batch positions, None for unpadded window batches
+        self.padding_waste = 1.0 - used_positions / padded_positions if padded_positions else None
         # return
         return avg_loss, avg_chord_accuracy, avg_duration_accuracy
 
-    def save_checkpoint(self, path: Path, epoch: int, vocab: Dict):
+    @torch.no_grad()
+    def evaluate(self, dataloader: DataLoader) -> Tuple[float, float, float]:
+        """(loss, chord accuracy, duration accuracy) over a whole dataset, weighted by target"""
+        self.forward_model.eval()
+        # sums of (loss * targets, correct chords, correct durations, targets)
+        totals = torch.zeros(4, device=self.device)
+        for batch in dataloader:
+            _, stats = self._loss(self.forward_model, *self._prepare_batch(batch))
+            totals += torch.stack([stats[0] * stats[3], stats[1], stats[2], stats[3]])
+        loss, chord_correct, duration_correct, count = totals.tolist()
+        count = max(count, 1)
+        self.val_losses.append(loss / count)
+        self.val_accuracies.append(chord_correct / count)
+        return loss / count, chord_correct / count, duration_correct / count
+
+    def save_checkpoint(self, path: Path, epoch: int, vocab: Dict, config: Optional[Dict] = None):
         checkpoint = {
             'epoch': epoch,
             'model_state_dict': self.model.state_dict(),
             'optimizer_state_dict': self.optimizer.state_dict(),
             'vocab': vocab
         }
-        torch.save(checkpoint, path)
-        logger.info(f"Saved checkpoint to {path}")
+        if config is not None:
+            # hyperparameters needed to rebuild the model, e.g. hidden_dim
+            checkpoint['config'] = config
+        if self.checkpoint_writer is not None:
+            # copy the state now; the writer thread serializes it while training goes on
+            self.checkpoint_writer.submit(snapshot(checkpoint), path)
+        else:
+            atomic_save(checkpoint, path)
+            logger.info(f"Saved checkpoint to {path}")
 
-    def load_checkpoint(self, path: Path) -> Tuple[int, Dict]:
+    def load_checkpoint(self, path: Path, duration_unit: Optional[str] = None) -> Tuple[int, Dict]:
         checkpoint = torch.load(path, map_location=self.device)
+        # checkpoints from before duration units were recorded all trained on frames
+        checkpoint_unit = checkpoint.get('config', {}).get('duration_unit', 'frames')
+        if duration_unit is not None and checkpoint_unit != duration_unit:
+            raise ValueError(f"{path} was trained on durations in {checkpoint_unit}, this dataset counts {duration_unit}")
         self.model.load_state_dict(checkpoint['model_state_dict'])
         self.optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
         return checkpoint['epoch'], checkpoint['vocab']
 
 
-def main():
-    parser = argparse.ArgumentParser(description='Train Chord Progression Model')
-    parser.add_argument('--data_path', type=str, default='dataset.pkl', help='Path to dataset pickle file')
-    parser.add_argument('--output_dir', type=str, default='checkpoints/', help='Directory to save checkpoints')
-    parser.add_argument('--sequence_length', type=int, default=3, help='Length of input sequences')
-    parser.add_argument('--batch_size', type=int, default=32, help='Batch size')
-    parser.add_argument('--num_epochs', type=int, default=100, help='Number of epochs')
-    parser.add_argument('--hidden_dim', type=int, default=64, help='Hidden dimension')
-    parser.add_argument('--checkpoint', type=str, help='Path to checkpoint to resume from')
-    args = parser.parse_args()
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _spawned_worker(rank: int, args: argparse.Namespace, nproc: int, port: int):
+    os.environ.update({
+        'MASTER_ADDR': '127.0.0.1',
+        'MASTER_PORT': str(port),
+        'RANK': str(rank),
+        'LOCAL_RANK': str(rank),
+        'WORLD_SIZE': str(nproc),
+        'LOCAL_WORLD_SIZE': str(nproc)
+    })
+    train(args)
+
+
+def spawn_training(args: argparse.Namespace, nproc: int):
+    """Run train(args) in nproc local processes, the same environment torchrun --nproc_per_node would set up"""
+    torch.multiprocessing.spawn(_spawned_worker, args=(args, nproc, _free_port()), nprocs=nproc)
+
+
+def train(args: argparse.Namespace):
     device = torch.device("mps" if torch.backends.mps.is_available() else "cpu")
-    logger.info(f"Using device: {device}")
+    # torchrun (or spawn_training) sets RANK and WORLD_SIZE; gloo keeps every rank on the cpu
+    world_size = int(os.environ.get('WORLD_SIZE', 1))
+    distributed = world_size > 1
+    rank = 0
+    if distributed:
+        dist.init_process_group('gloo')
+        rank = dist.get_rank()
+        device = torch.device('cpu')
+        # only rank 0 reports progress
+        if rank != 0:
+            logger.setLevel(logging.WARNING)
+        local_world_size = int(os.environ.get('LOCAL_WORLD_SIZE', world_size))
+        torch.set_num_threads(args.threads or max(1, (os.cpu_count() or 1) // local_world_size))
+    elif args.threads:
+        torch.set_num_threads(args.threads)
+    logger.info(f"Using device: {device}" + (f", {world_size} processes x {torch.get_num_threads()} threads" if distributed else ""))
     # output directory
     output_dir = Path(args.output_dir)
-    output_dir.mkdir(parents=True, exist_ok=True)
+    if rank == 0:
+        output_dir.mkdir(parents=True, exist_ok=True)
     # init vocabulary and dataset
     chord_types = create_chord_vocabulary()
     chord_to_idx = {chord: idx for idx, chord in enumerate(chord_types)}
-    dataset = load_dataset(args.data_path)
-    # init model + trainer
+    # init model + trainer; the seed gives every rank the same initial weights
+    torch.manual_seed(args.seed)
     model = ChordLSTM(
         vocab_size=len(chord_types),
         hidden_dim=args.hidden_dim
     ).to(device)
-    trainer = ChordTrainer(model, device)
-    # load model checkpoint
+    checkpoint_writer = CheckpointWriter() if rank == 0 else None
+    step_log = StepLog(output_dir / STEP_METRICS_FILE) if args.step_metrics and rank == 0 else None
+    trainer = ChordTrainer(model, device, compile_model=args.compile, precision=args.precision, log_every=args.log_every,
+                           objective=args.objective, packed=args.packed, distributed=distributed,
+                           checkpoint_writer=checkpoint_writer, step_log=step_log)
+    if args.profile and rank == 0:
+        start, end = parse_step_range(args.profile)
+        trainer.start_profiler(start, end, output_dir / f"trace_steps_{start}-{end - 1}.json")
+    # init dataset + loader
+    if Path(args.data_path).is_dir():
+        # already compiled, e.g. by ingest_csv.py
+        chord_dataset = load_compiled_dataset(Path(args.data_path), sequence_length=args.sequence_length, chord_to_idx=chord_to_idx)
+    elif args.no_cache:
+        chord_dataset = ChordDataset(load_dataset(args.data_path), args.sequence_length, chord_to_idx)
+    else:
+        # rank 0 compiles the cache, the others wait and map the same files
+        if rank != 0:
+            dist.barrier()
+        chord_dataset = load_cached_dataset(Path(args.data_path), args.sequence_length, chord_to_idx, Path(args.cache_dir))
+        if distributed and rank == 0:
+            dist.barrier()
+    logger.info(f"Dataset size: {len(chord_dataset)} sequences")
+    duration_unit = chord_dataset.duration_unit
+    # load model checkpoint; every rank reads the same file, so replicas stay in sync
     start_epoch = 0
     if args.checkpoint:
-        start_epoch, _ = trainer.load_checkpoint(Path(args.checkpoint))
+        start_epoch, _ = trainer.load_checkpoint(Path(args.checkpoint), duration_unit=duration_unit)
         logger.info(f"Resumed from epoch {start_epoch}")
-    # init dataset + loader
-    chord_dataset = ChordDataset(dataset, args.sequence_length, chord_to_idx)
-    logger.info(f"Dataset size: {len(chord_dataset)} sequences")
-    dataloader = DataLoader(
-        chord_dataset,
-        batch_size=args.batch_size,
-        shuffle=True,
-        num_workers=4
-    )
+    val_dataset = None
+    if args.val_fraction > 0:
+        # the same seed on every rank gives every rank the same split
+        chord_dataset, val_dataset = chord_dataset.split_pieces(args.val_fraction, seed=args.seed)
+        logger.info(f"Validation split: {len(val_dataset.pieces)} pieces, {len(val_dataset)} sequences held out")
+    if args.objective == 'sequence':
+        chord_dataset = SequenceChunks(chord_dataset, args.chunk_length or None)
+        logger.info(f"Sequence objective: {len(chord_dataset)} chunks, {chord_dataset.num_targets()} targets")
+        if val_dataset is not None:
+            val_dataset = SequenceChunks(val_dataset, args.chunk_length or None)
+    if val_dataset is not None and len(val_dataset) == 0:
+        logger.warning("Validation split is empty; training without validation")
+        val_dataset = None
+    # every rank scores the whole validation set, so they all reach the same stopping decision
+    val_loader = BatchLoader(
+        val_dataset, batch_size=args.eval_batch_size, shuffle=False, bucket_by_length=args.objective == 'sequence'
+    ) if val_dataset is not None else None
+    # pinned host memory only speeds up copies to a cuda device
+    pin_memory = device.type == 'cuda'
+    if args.loader == 'fast':
+        # each rank gets a disjoint shard of the same seeded permutation
+        dataloader = BatchLoader(
+            chord_dataset,
+            batch_size=args.batch_size,
+            shuffle=True,
+            pin_memory=pin_memory,
+            prefetch=args.prefetch,
+            bucket_by_length=args.bucket and args.objective == 'sequence',
+            rank=rank,
+            world_size=world_size,
+            seed=args.seed
+        )
+        sampler = dataloader
+    else:
+        sampler = DistributedSampler(chord_dataset, num_replicas=world_size, rank=rank, seed=args.seed) if distributed else None
+        dataloader = DataLoader(
+            chord_dataset,
+            batch_size=args.batch_size,
+            shuffle=sampler is None,
+            sampler=sampler,
+            num_workers=args.num_workers,
+            pin_memory=pin_memory
+        )
+    config = {'hidden_dim': args.hidden_dim, 'sequence_length': args.sequence_length,
+              'duration_unit': duration_unit}
+    best_loss, best_epoch = float('inf'), start_epoch
+    # weights and optimizer state of the best validation epoch, restored into final_model.pt
+    best_state = None
+    last_epoch = start_epoch
+    metrics_path = output_dir / METRICS_FILE
+    if rank == 0 and not args.checkpoint:
+        metrics_path.unlink(missing_ok=True)
+    plots = []
     # train
     for epoch in range(start_epoch, args.num_epochs):
+        if sampler is not None:
+            sampler.set_epoch(epoch)
+        start = time.perf_counter()
         loss, chord_acc, duration_acc = trainer.train_epoch(dataloader)
+        last_epoch = epoch + 1
+        samples_per_second = len(chord_dataset) / (time.perf_counter() - start)
         logger.info(
             f"Epoch [{epoch + 1}/{args.num_epochs}] "
             f"Loss: {loss:.4f} "
             f"Chord Accuracy: {chord_acc:.4f} "
-            f"Duration Accuracy: {duration_acc:.4f}"
+            f"Duration Accuracy: {duration_acc:.4f} "
+            f"({samples_per_second:,.0f} samples/s)"
+            + (f", padding {trainer.padding_waste:.1%}" + (" (skipped by packing)" if args.packed else "")
+               if trainer.padding_waste is not None else "")
         )
-        # save + visualize
-        if (epoch + 1) % 25 == 0:
-            checkpoint_path = output_dir / f"checkpoint_epoch_{epoch + 1}.pt"
-            trainer.save_checkpoint(checkpoint_path, epoch + 1, chord_to_idx)
-            plot_training_metrics(
-                trainer.losses,
-                trainer.accuracies,
-                trainer.duration_accuracies,  # Changed from mses
-                epoch + 1,
-                output_dir
+        row = {
+            'epoch': epoch + 1,
+            'loss': loss,
+            'chord_accuracy': chord_acc,
+            'duration_accuracy': duration_acc,
+            'samples_per_second': samples_per_second,
+            'peak_memory_mb': peak_memory_mb(device),
+            'lr': trainer.optimizer.param_groups[0]['lr']
+        }
+        if trainer.padding_waste is not None:
+            row['padding_waste'] = trainer.padding_waste
+        if val_loader is not None:
+            val_loss, val_chord_acc, val_duration_acc = trainer.evaluate(val_loader)
+            row.update(val_loss=val_loss, val_chord_accuracy=val_chord_acc, val_duration_accuracy=val_duration_acc)
+            trainer.scheduler.step(val_loss)
+            logger.info(
+                f"  Validation Loss: {val_loss:.4f} "
+                f"Chord Accuracy: {val_chord_acc:.4f} "
+                f"Duration Accuracy: {val_duration_acc:.4f} "
+                f"LR: {trainer.optimizer.param_groups[0]['lr']:.2e}"
             )
+            if val_loss < best_loss - args.min_delta:
+                best_loss, best_epoch = val_loss, epoch + 1
+                if rank == 0:
+                    best_state = snapshot({'model': model.state_dict(), 'optimizer': trainer.optimizer.state_dict()})
+                    trainer.save_checkpoint(output_dir / 'best_model.pt', epoch + 1, chord_to_idx, config=config)
+        if rank == 0:
+            with open(metrics_path, 'a') as file:
+                file.write(json.dumps(row) + '\n')
+        # save + visualize, from one rank only; plots render in their own process
+        if rank == 0 and (epoch + 1) % 25 == 0:
+            checkpoint_path = output_dir / f"checkpoint_epoch_{epoch + 1}.pt"
+            trainer.save_checkpoint(checkpoint_path, epoch + 1, chord_to_idx, config=config)
+            plots = [plot for plot in plots if plot.poll() is None]
+            plots.append(spawn_plot(metrics_path, epoch + 1, output_dir))
+        if val_loader is not None and args.patience and epoch + 1 - best_epoch >= args.patience:
+            logger.info(f"Stopping early: no validation improvement since epoch {best_epoch} (best loss {best_loss:.4f})")
+            break
     # save final model
-    trainer.save_checkpoint(output_dir / 'final_model.pt', args.num_epochs, chord_to_idx)
+    if rank == 0:
+        final_epoch = last_epoch
+        if best_state is not None and best_epoch != last_epoch:
+            # main.py serves final_model.pt, so it gets the best validation epoch, not the last one
+            model.load_state_dict(best_state['model'])
+            trainer.optimizer.load_state_dict(best_state['optimizer'])
+            final_epoch = best_epoch
+            logger.info(f"Restored epoch {best_epoch} (validation loss {best_loss:.4f}) for the final model")
+        trainer.save_checkpoint(output_dir / 'final_model.pt', final_epoch, chord_to_idx, config=config)
+        checkpoint_writer.close()
+        if step_log is not None:
+            step_log.close()
+            # skip the first steps, which include warmup and compilation
+            summary = summarize_steps(step_log.path, skip=min(10, trainer.global_step // 10))
+            if summary:
+                logger.info(
+                    "Mean step: " + ", ".join(f"{phase} {summary[phase] * 1000:.2f} ms" for phase in PHASES)
+                    + f", {summary['samples_per_second']:,.0f} samples/s, peak memory {summary['peak_memory_mb']:.0f} MB"
+                )
+        for plot in plots:
+            plot.wait()
+    if distributed:
+        dist.destroy_process_group()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train Chord Progression Model')
+    parser.add_argument('--data_path', type=str, default='dataset.pkl', help='Path to dataset pickle file or compiled dataset directory')
+    parser.add_argument('--output_dir', type=str, default='checkpoints/', help='Directory to save checkpoints')
+    parser.add_argument('--sequence_length', type=int, default=3, help='Length of input sequences')
+    parser.add_argument('--batch_size', type=int, default=32, help='Batch size')
+    parser.add_argument('--num_epochs', type=int, default=100, help='Number of epochs')
+    parser.add_argument('--hidden_dim', type=int, default=64, help='Hidden dimension')
+    parser.add_argument('--checkpoint', type=str, help='Path to checkpoint to resume from')
+    parser.add_argument('--cache_dir', type=str, default='cache/', help='Directory for compiled, memory-mapped datasets')
+    parser.add_argument('--no_cache', action='store_true', help='Rebuild the dataset from the pickle on every run')
+    parser.add_argument('--loader', type=str, default='fast', choices=['fast', 'torch'],
+                        help='fast: in-process batches sliced from the dataset tensors; torch: DataLoader with worker processes')
+    parser.add_argument('--num_workers', type=int, default=4, help='DataLoader worker processes (--loader torch)')
+    parser.add_argument('--prefetch', type=int, default=0, help='Batches prepared ahead on a background thread (--loader fast)')
+    parser.add_argument('--log_every', type=int, default=0, help='Log running metrics every N steps (0: once per epoch)')
+    parser.add_argument('--compile', action='store_true', help='Train through torch.compile')
+    parser.add_argument('--objective', type=str, default='window', choices=['window', 'sequence'],
+                        help='window: predict the chord after each sequence_length window; sequence: teacher-forced loss at every step')
+    parser.add_argument('--chunk_length', type=int, default=32, help='Steps per training chunk, 0 for whole pieces (--objective sequence)')
+    parser.add_argument('--bucket', action='store_true', help='Batch chunks of similar length together (--objective sequence)')
+    parser.add_argument('--packed', action='store_true', help='Run the LSTM over packed sequences, skipping padding (--objective sequence)')
+    parser.add_argument('--precision', type=str, default='fp32', choices=['fp32', 'bf16'], help='bf16 runs forward and loss under cpu autocast (cpu only)')
+    parser.add_argument('--val_fraction', type=float, default=0.1, help='Share of pieces held out for validation (0: no validation)')
+    parser.add_argument('--eval_batch_size', type=int, default=1024, help='Batch size for the validation pass')
+    parser.add_argument('--patience', type=int, default=10, help='Stop after this many epochs without a better validation loss (0: never)')
+    parser.add_argument('--min_delta', type=float, default=1e-4, help='Smallest validation loss decrease that counts as better')
+    parser.add_argument('--step_metrics', action='store_true',
+                        help=f'Time data wait, forward, backward and optimizer per step into <output_dir>/{STEP_METRICS_FILE}')
+    parser.add_argument('--profile', type=str, default=None, metavar='START:END',
+                        help='Record training steps START to END-1 with torch.profiler into a Chrome trace in output_dir')
+    parser.add_argument('--nproc', type=int, default=1, help='Data-parallel CPU processes to spawn (gloo); not needed under torchrun')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the initial weights and the shuffle order')
+    parser.add_argument('--threads', type=int, default=0, help='torch threads per process (0: cores / processes when distributed)')
+    args = parser.parse_args()
+    if args.nproc > 1 and 'WORLD_SIZE' not in os.environ:
+        spawn_training(args, args.nproc)
+    else:
+        train(args)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
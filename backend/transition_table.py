@@ -0,0 +1,141 @@
+import itertools
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from decoding import batch_arguments, decode_rows
+
+
+class TransitionTable:
+    """Precomputed next-chord/duration distributions for a fixed-context model.
+
+    With a sliding window of `sequence_length` chords over a small vocabulary
+    there are only vocab_size ** sequence_length contexts, so every output
+    distribution is computed once and generation just samples from tables.
+    """
+
+    def __init__(self, chord_logits: np.ndarray, duration_logits: np.ndarray, chord_to_idx: Dict[str, int],
+                 sequence_length: int, max_cached_temperatures: int = 32):
+        self.chord_logits = chord_logits.astype(np.float64)
+        self.duration_logits = duration_logits.astype(np.float64)
+        self.chord_to_idx = chord_to_idx
+        self.idx_to_chord = {idx: chord for chord, idx in chord_to_idx.items()}
+        self.vocab_size = len(chord_to_idx)
+        self.sequence_length = sequence_length
+        self.max_cached_temperatures = max_cached_temperatures
+        self._cdfs = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def all_contexts(vocab_size: int, sequence_length: int) -> np.ndarray:
+        # row i holds the base-vocab_size digits of i, most significant first
+        return np.array(list(itertools.product(range(vocab_size), repeat=sequence_length)), dtype=np.int64)
+
+    @classmethod
+    def from_model(cls, model, chord_to_idx: Dict[str, int], sequence_length: int,
+                   device=None) -> 'TransitionTable':
+        # device=None means a NumpyChordLSTM, anything else a torch ChordLSTM on that device
+        contexts = cls.all_contexts(len(chord_to_idx), sequence_length)
+        chord_logits, duration_logits, _ = cls._run(model, contexts, device, stepwise=False)
+        return cls(chord_logits, duration_logits, chord_to_idx, sequence_length)
+
+    @staticmethod
+    def _run(model, contexts: np.ndarray, device, stepwise: bool):
+        if device is None:
+            if not stepwise:
+                return model.step(contexts)
+            state = None
+            for position in range(contexts.shape[1]):
+                chord_logits, duration_logits, state = model.step(contexts[:, position:position + 1], state)
+            return chord_logits, duration_logits, state
+        import torch
+        model.eval()
+        contexts = torch.from_numpy(contexts).to(device)
+        with torch.no_grad():
+            if stepwise:
+                state = None
+                for position in range(contexts.shape[1]):
+                    chord_logits, duration_logits, state = model.step(contexts[:, position:position + 1], state)
+            else:
+                chord_logits, duration_logits, state = model.step(contexts)
+        return chord_logits.cpu().numpy(), duration_logits.cpu().numpy(), state
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        logits = logits.astype(np.float64)
+        probs = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return probs / probs.sum(axis=1, keepdims=True)
+
+    def max_error(self, model, device=None) -> float:
+        """Largest probability difference against the model stepped token by token"""
+        contexts = self.all_contexts(self.vocab_size, self.sequence_length)
+        chord_logits, duration_logits, _ = self._run(model, contexts, device, stepwise=True)
+        chord_table, duration_table = (np.diff(cdf, axis=1, prepend=0.0) for cdf in self.cdfs(1.0))
+        return float(max(
+            np.abs(chord_table - self._softmax(chord_logits)).max(),
+            np.abs(duration_table - self._softmax(duration_logits)).max()
+        ))
+
+    @staticmethod
+    def _cdf(logits: np.ndarray, temperature: float) -> np.ndarray:
+        scaled = logits / temperature
+        probs = np.exp(scaled - scaled.max(axis=1, keepdims=True))
+        cdf = np.cumsum(probs, axis=1)
+        # last column is exactly 1.0, so (cdf < u).sum() is always a valid index
+        return cdf / cdf[:, -1:]
+
+    def cdfs(self, temperature: float) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            cached = self._cdfs.get(temperature)
+            if cached is not None:
+                self._cdfs.move_to_end(temperature)
+                return cached
+        cached = (self._cdf(self.chord_logits, temperature), self._cdf(self.duration_logits, temperature))
+        with self._lock:
+            self._cdfs[temperature] = cached
+            while len(self._cdfs) > self.max_cached_temperatures:
+                self._cdfs.popitem(last=False)
+        return cached
+
+    def _context(self, seed_progression: List[str]) -> int:
+        # last sequence_length chords read as a base-vocab_size number
+        context = 0
+        for chord in seed_progression[-self.sequence_length:]:
+            context = context * self.vocab_size + self.chord_to_idx.get(chord, 0)
+        return context
+
+    def stream_progression(self, seed_progression: List[str], length: int = 8, temperature: float = 1.0) -> Iterator[Tuple[str, int]]:
+        rng = np.random.default_rng()
+        chord_cdf, duration_cdf = self.cdfs(temperature)
+        num_contexts = self.vocab_size ** self.sequence_length
+        context = self._context(seed_progression)
+        for _ in range(length):
+            chord_idx = int(np.searchsorted(chord_cdf[context], rng.random()))
+            duration_idx = int(np.searchsorted(duration_cdf[context], rng.random()))
+            yield self.idx_to_chord[chord_idx], duration_idx + 1
+            context = (context * self.vocab_size + chord_idx) % num_contexts
+
+    def generate_batch(self, seed_progressions: List[List[str]], length: int = 8, temperatures: Optional[List[float]] = None,
+                       lengths: Optional[List[int]] = None) -> List[List[Tuple[str, int]]]:
+        count = len(seed_progressions)
+        temperatures, lengths, max_length = batch_arguments(count, length, temperatures, lengths)
+        rng = np.random.default_rng()
+        num_contexts = self.vocab_size ** self.sequence_length
+        context = np.array([self._context(seed) for seed in seed_progressions], dtype=np.int64)
+        groups = []
+        for temperature in sorted(set(temperatures)):
+            rows = np.array([row for row in range(count) if temperatures[row] == temperature])
+            groups.append((rows, *self.cdfs(temperature)))
+        chord_out = np.zeros((count, max_length), dtype=np.int64)
+        duration_out = np.zeros((count, max_length), dtype=np.int64)
+        for step in range(max_length):
+            chord_u = rng.random(count)
+            duration_u = rng.random(count)
+            for rows, chord_cdf, duration_cdf in groups:
+                rows_context = context[rows]
+                chord_out[rows, step] = (chord_cdf[rows_context] < chord_u[rows, None]).sum(axis=1)
+                duration_out[rows, step] = (duration_cdf[rows_context] < duration_u[rows, None]).sum(axis=1)
+            context = (context * self.vocab_size + chord_out[:, step]) % num_contexts
+        return decode_rows(self.idx_to_chord, chord_out.tolist(), duration_out.tolist(), lengths)
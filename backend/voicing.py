@@ -0,0 +1,102 @@
+from typing import List, Optional
+
+import numpy as np
+
+# MIDI numbers for the octave starting at middle C
+NOTES = {
+    'C': 60, 'C#': 61, 'Db': 61,
+    'D': 62, 'D#': 63, 'Eb': 63,
+    'E': 64,
+    'F': 65, 'F#': 66, 'Gb': 66,
+    'G': 67, 'G#': 68, 'Ab': 68,
+    'A': 69, 'A#': 70, 'Bb': 70,
+    'B': 71
+}
+TONICS = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+MODES = ['M', 'm']
+MAJOR_TRIAD = [0, 4, 7]
+MINOR_TRIAD = [0, 3, 7]
+DIM_TRIAD = [0, 3, 6]
+# every spelling of the seven degrees: upper, lower and diminished
+NUMERALS = [
+    spelling
+    for degree in ['I', 'II', 'III', 'IV', 'V', 'VI', 'VII']
+    for spelling in (degree, degree.lower(), degree.lower() + '°')
+]
+NUMERAL_INDEX = {numeral: idx for idx, numeral in enumerate(NUMERALS)}
+
+
+def _voice(roman_numeral: str, base_midi: int, mode: str) -> List[int]:
+    # reference voicing the table is built from; the degree ignores the ° marker
+    if mode == 'M':
+        scale_degrees = [0, 2, 4, 5, 7, 9, 11]  # Major scale
+    else:
+        scale_degrees = [0, 2, 3, 5, 7, 8, 10]  # Natural minor scale
+    numerals = ['i', 'ii', 'iii', 'iv', 'v', 'vi', 'vii'] if mode == 'm' else ['I', 'II', 'III', 'IV', 'V', 'VI',
+                                                                               'VII']
+    degree_name = roman_numeral.rstrip('°')
+    degree = numerals.index(degree_name.upper() if mode == 'M' else degree_name.lower())
+    root_midi = base_midi + scale_degrees[degree]
+    if mode == 'M':
+        if roman_numeral in ['I', 'IV', 'V']:
+            intervals = MAJOR_TRIAD
+        elif roman_numeral in ['ii', 'iii', 'vi']:
+            intervals = MINOR_TRIAD
+        else:
+            intervals = DIM_TRIAD
+    else:
+        if roman_numeral in ['III', 'VI', 'VII']:
+            intervals = MAJOR_TRIAD
+        elif roman_numeral in ['i', 'iv', 'v']:
+            intervals = MINOR_TRIAD
+        else:
+            intervals = DIM_TRIAD
+    return [root_midi + interval for interval in intervals]
+
+
+# VOICINGS[numeral, tonic pitch class, mode] -> three MIDI notes
+VOICINGS = np.array([
+    [[_voice(numeral, NOTES['C'] + pitch_class, mode) for mode in MODES] for pitch_class in range(12)]
+    for numeral in NUMERALS
+], dtype=np.int64)
+VOICINGS.setflags(write=False)
+# nested-list copy for single lookups, where numpy indexing overhead dominates
+_VOICING_LISTS = VOICINGS.tolist()
+
+
+def _numeral_indices(roman_numerals: List[str]) -> np.ndarray:
+    try:
+        return np.array([NUMERAL_INDEX[numeral] for numeral in roman_numerals], dtype=np.int64)
+    except KeyError as e:
+        raise ValueError(f"Unknown roman numeral: {e.args[0]}")
+
+
+def _mode_index(mode: str) -> int:
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode: {mode}")
+    return MODES.index(mode)
+
+
+def _pitch_classes(tonics: List[str]) -> np.ndarray:
+    try:
+        return np.array([NOTES[tonic] - NOTES['C'] for tonic in tonics], dtype=np.int64)
+    except KeyError as e:
+        raise ValueError(f"Unknown tonic: {e.args[0]}")
+
+
+def roman_to_midi_notes(roman_numeral: str, tonic: str, mode: str) -> List[int]:
+    if roman_numeral not in NUMERAL_INDEX:
+        raise ValueError(f"Unknown roman numeral: {roman_numeral}")
+    if tonic not in NOTES:
+        raise ValueError(f"Unknown tonic: {tonic}")
+    pitch_class = NOTES[tonic] - NOTES['C']
+    return list(_VOICING_LISTS[NUMERAL_INDEX[roman_numeral]][pitch_class][_mode_index(mode)])
+
+
+def voice_progression(roman_numerals: List[str], tonics: Optional[List[str]] = None, mode: str = 'M') -> np.ndarray:
+    """Voice a whole progression in one lookup: (len(tonics), len(roman_numerals), 3) MIDI notes.
+
+    All 12 tonics (in TONICS order) are voiced when `tonics` is None.
+    """
+    pitch_classes = np.arange(12) if tonics is None else _pitch_classes(tonics)
+    return VOICINGS[_numeral_indices(roman_numerals)[None, :], pitch_classes[:, None], _mode_index(mode)]